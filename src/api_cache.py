@@ -0,0 +1,115 @@
+import json
+import logging
+import sqlite3
+import threading
+import zlib
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    kind TEXT NOT NULL,
+    playlist_id TEXT NOT NULL,
+    snapshot_id TEXT NOT NULL,
+    page_offset INTEGER NOT NULL,
+    page_limit INTEGER NOT NULL,
+    body BLOB NOT NULL,
+    PRIMARY KEY (kind, playlist_id, snapshot_id, page_offset, page_limit)
+);
+"""
+
+MODES = ('off', 'record', 'replay')
+
+class CacheMissError(Exception):
+    """La respuesta pedida no está grabada en la caché"""
+
+class ApiCache:
+    """
+    Caché en disco de respuestas crudas de la API de Spotify.
+    En modo record guarda cada respuesta de current_user_playlists y
+    playlist_items; en modo replay las sirve desde disco sin tocar la red.
+    Las páginas de tracks se indexan por playlist, snapshot_id, offset y
+    tamaño de página, y se guardan como JSON comprimido con zlib. Al
+    reproducir, una página más chica que la grabada en el mismo offset (la
+    última de una playlist, o cualquiera si cambió el tamaño) se recorta de
+    la grabada.
+    """
+    def __init__(self, mode: str = 'off', path: str = 'api_cache.db'):
+        if mode not in MODES:
+            raise ValueError(f"Modo de caché desconocido: {mode} (opciones: {', '.join(MODES)})")
+        self.mode = mode
+        self.path = path
+        self._local = threading.local()
+        if mode != 'off':
+            self._conn().executescript(SCHEMA)
+            logger.info(f"💽 Caché de la API en modo {mode}: {path}")
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == 'record'
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == 'replay'
+
+    def _conn(self) -> sqlite3.Connection:
+        # Una conexión por hilo: las páginas se graban desde el pool de páginas
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _get(self, kind: str, playlist_id: str, snapshot_id: Optional[str], offset: int, limit: int) -> Optional[Dict]:
+        row = self._conn().execute(
+            "SELECT body FROM responses WHERE kind = ? AND playlist_id = ? AND snapshot_id = ? "
+            "AND page_offset = ? AND page_limit = ?",
+            (kind, playlist_id, snapshot_id or '', offset, limit)
+        ).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row else None
+
+    def _put(self, kind: str, playlist_id: str, snapshot_id: Optional[str], offset: int, limit: int, response: Dict):
+        body = zlib.compress(json.dumps(response, separators=(',', ':')).encode('utf-8'))
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, playlist_id, snapshot_id or '', offset, limit, body)
+            )
+
+    def get_page(self, playlist_id: str, snapshot_id: Optional[str], offset: int, limit: int) -> Optional[Dict]:
+        """Devuelve una página de playlist_items grabada, o None si no está"""
+        page = self._get('items', playlist_id, snapshot_id, offset, limit)
+        if page is None:
+            row = self._conn().execute(
+                "SELECT body FROM responses WHERE kind = 'items' AND playlist_id = ? AND snapshot_id = ? "
+                "AND page_offset = ? AND page_limit > ? ORDER BY page_limit LIMIT 1",
+                (playlist_id, snapshot_id or '', offset, limit)
+            ).fetchone()
+            if row is not None:
+                page = json.loads(zlib.decompress(row[0]))
+                page['items'] = page['items'][:limit]
+        if page is None:
+            logger.warning(f"💽 Página no grabada: {playlist_id}@{snapshot_id} offset {offset}")
+        return page
+
+    def recorded_page_size(self) -> Optional[int]:
+        """Tamaño de página con el que se grabaron las páginas de tracks (el más frecuente), o None si no hay"""
+        row = self._conn().execute(
+            "SELECT page_limit FROM responses WHERE kind = 'items' "
+            "GROUP BY page_limit ORDER BY COUNT(*) DESC, page_limit DESC LIMIT 1"
+        ).fetchone()
+        return row[0] if row else None
+
+    def put_page(self, playlist_id: str, snapshot_id: Optional[str], offset: int, limit: int, response: Dict):
+        self._put('items', playlist_id, snapshot_id, offset, limit, response)
+
+    def get_listing(self, offset: int, limit: int) -> Dict:
+        """Devuelve una página grabada de current_user_playlists"""
+        page = self._get('playlists', '', None, offset, limit)
+        if page is None:
+            raise CacheMissError(f"Listado de playlists no grabado en offset {offset}")
+        return page
+
+    def put_listing(self, offset: int, limit: int, response: Dict):
+        self._put('playlists', '', None, offset, limit, response)
@@ -0,0 +1,190 @@
+"""
+Benchmark del escaneo contra un servidor local que imita la API de Spotify.
+
+Ejemplo:
+    python benchmark.py --playlists 30 --tracks 300 --workers 2,4,8 --batch-sizes 50,100,auto \
+        --latency-ms 80 --rate-429 0.02 --error-5xx 0.01 --json bench.json
+
+Con --compare se comparan los tracks/segundo contra un JSON anterior y el
+proceso termina con código 1 si alguna configuración empeora más que --tolerance.
+Un tamaño de página "auto" deja que el planificador lo ajuste empezando en 100.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from log_pipeline import setup_logging
+from mock_spotify import FaultInjector, MockLibrary, MockSpotifyServer
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+def run_scan(z, server: MockSpotifyServer, workdir: str, workers: int, batch_size: str, args) -> Dict:
+    """Ejecuta un escaneo completo con una configuración y devuelve sus métricas"""
+    z.CONFIG['MAX_WORKERS'] = workers
+    z.CONFIG['COVERS_PREFETCH'] = False  # Solo se mide el escaneo, no la descarga de portadas
+    z.CONFIG['ADAPTIVE_PAGE_SIZE'] = batch_size == 'auto'
+    z.CONFIG['BATCH_SIZE'] = z.MAX_PAGE_SIZE if batch_size == 'auto' else int(batch_size)
+    z.CONFIG['PAGE_CONCURRENCY'] = args.page_concurrency or workers
+    rate_limiter = z.RateLimiter(
+        requests_per_second=args.rate,
+        burst=z.CONFIG['RATE_BURST'],
+        min_rate=z.CONFIG['RATE_MIN'],
+        max_rate=max(args.rate, args.rate_max),
+        increase=z.CONFIG['RATE_INCREASE']
+    )
+    # El tope global no debe limitar más que la tasa máxima del benchmark
+    top_rate = max(args.rate, args.rate_max)
+    z.global_rate_limiter = z.RateLimiter(top_rate, z.CONFIG['GLOBAL_BURST'], top_rate, top_rate, 0)
+    z.page_executor = ThreadPoolExecutor(max_workers=z.CONFIG['PAGE_CONCURRENCY'], thread_name_prefix='page')
+    store = z.ResultsStore(os.path.join(workdir, f'w{workers}_b{batch_size}.db'),
+                           os.path.join(workdir, f'w{workers}_b{batch_size}.json'))
+    account = z.Account('benchmark', z.default_auth_manager(), z.new_http_session(z.CONFIG['PAGE_CONCURRENCY'] + 1),
+                        store, z.ApiCache('off'), rate_limiter)
+    z.accounts = [account]
+    z.page_latency = z.LatencyTracker()
+    z.hedge_stats.update(requests=0, hedges=0)
+
+    # Apuntar el cliente al servidor local con un token fijo
+    sp = account.session_manager.sp
+    sp.prefix = f'{server.base_url}/v1/'
+    sp.set_auth('benchmark-token')
+    latencies = []
+    latencies_lock = threading.Lock()
+    playlist_items = sp.playlist_items
+
+    def timed_playlist_items(*a, **kw):
+        start = time.perf_counter()
+        try:
+            return playlist_items(*a, **kw)
+        finally:
+            with latencies_lock:
+                latencies.append(time.perf_counter() - start)
+    sp.playlist_items = timed_playlist_items
+
+    server.stats.update({"requests": 0, "429": 0, "5xx": 0, "bytes": 0})
+    start = time.perf_counter()
+    z.process_playlists()
+    z.save_all_results()
+    wall = time.perf_counter() - start
+
+    results = store.load()
+    tracks = sum(r['total_tracks'] + r['invalid_tracks'] for r in results.values())
+    z.page_executor.shutdown()
+    return {
+        "workers": workers,
+        "batch_size": batch_size,
+        "playlists": len(results),
+        "tracks": tracks,
+        "wall_s": round(wall, 3),
+        "tracks_per_s": round(tracks / wall, 1) if wall else 0.0,
+        "page_p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "page_p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "requests": server.stats["requests"],
+        "429": server.stats["429"],
+        "5xx": server.stats["5xx"],
+        "kb": round(server.stats["bytes"] / 1024),
+        "page_size": account.page_planner.page_size,
+        "hedges": z.hedge_stats['hedges']
+    }
+
+def print_table(rows: List[Dict]):
+    columns = ["workers", "batch_size", "tracks", "wall_s", "tracks_per_s",
+               "page_p50_ms", "page_p99_ms", "requests", "429", "5xx", "kb", "page_size", "hedges"]
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in columns}
+    print("  ".join(c.rjust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(str(row[c]).rjust(widths[c]) for c in columns))
+
+def compare(rows: List[Dict], baseline_path: str, tolerance: float) -> bool:
+    """Compara tracks/segundo con un benchmark anterior; devuelve False si hay regresiones"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {(r['workers'], str(r['batch_size'])): r for r in json.load(f)['runs']}
+    ok = True
+    for row in rows:
+        before = baseline.get((row['workers'], row['batch_size']))
+        if not before or not before['tracks_per_s']:
+            continue
+        change = row['tracks_per_s'] / before['tracks_per_s'] - 1
+        regression = change < -tolerance
+        ok = ok and not regression
+        print(f"{'❌' if regression else '✅'} workers={row['workers']} batch={row['batch_size']}: "
+              f"{before['tracks_per_s']} -> {row['tracks_per_s']} tracks/s ({change:+.1%})")
+    return ok
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de Zortify contra una API de Spotify simulada")
+    parser.add_argument('--playlists', type=int, default=20, help="playlists en la biblioteca sintética")
+    parser.add_argument('--tracks', type=int, default=200, help="tracks promedio por playlist")
+    parser.add_argument('--spread', type=float, default=0.5, help="variación relativa del tamaño de las playlists")
+    parser.add_argument('--episodes', type=float, default=0.02, help="fracción de episodios de podcast")
+    parser.add_argument('--unplayable', type=float, default=0.02, help="fracción de tracks no reproducibles")
+    parser.add_argument('--nulls', type=float, default=0.01, help="fracción de items sin track")
+    parser.add_argument('--latency-ms', type=float, default=50.0, help="latencia mediana por petición")
+    parser.add_argument('--jitter', type=float, default=0.5, help="sigma de la latencia log-normal")
+    parser.add_argument('--rate-429', type=float, default=0.0, help="probabilidad de responder 429")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After de los 429 (segundos)")
+    parser.add_argument('--error-5xx', type=float, default=0.0, help="probabilidad de iniciar una ráfaga de 503")
+    parser.add_argument('--burst', type=int, default=3, help="largo de las ráfagas de 503")
+    parser.add_argument('--workers', default='2,4', help="valores de MAX_WORKERS separados por coma")
+    parser.add_argument('--batch-sizes', default='auto',
+                        help="tamaños de página separados por coma (auto: adaptativo)")
+    parser.add_argument('--page-concurrency', type=int, default=0, help="PAGE_CONCURRENCY (0 = igual a workers)")
+    parser.add_argument('--rate', type=float, default=20.0, help="tasa inicial del limitador (peticiones/segundo)")
+    parser.add_argument('--rate-max', type=float, default=50.0, help="tasa máxima del limitador")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="guardar los resultados en este archivo")
+    parser.add_argument('--compare', help="JSON de un benchmark anterior para detectar regresiones")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="caída de tracks/s tolerada al comparar")
+    parser.add_argument('--verbose', action='store_true', help="mostrar el log del escaneo")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    json_path = os.path.abspath(args.json) if args.json else None
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+    workdir = tempfile.mkdtemp(prefix='zortify-bench-')
+    # El escaneo escribe su log y su almacén en el directorio actual
+    os.chdir(workdir)
+    for var in ('SPOTIPY_CLIENT_ID', 'SPOTIPY_CLIENT_SECRET'):
+        os.environ.setdefault(var, 'benchmark')
+    os.environ.setdefault('SPOTIPY_REDIRECT_URI', 'http://127.0.0.1:8888/callback')
+    import zortify as z
+    setup_logging(None, level=logging.INFO if args.verbose else logging.WARNING)
+
+    library = MockLibrary(args.playlists, args.tracks, args.spread, args.episodes,
+                          args.unplayable, args.nulls, args.seed)
+    faults = FaultInjector(args.latency_ms, args.jitter, args.rate_429, args.retry_after,
+                           args.error_5xx, args.burst, args.seed)
+    server = MockSpotifyServer(library, faults)
+    server.start()
+    print(f"Biblioteca sintética: {args.playlists} playlists, {sum(library.totals)} tracks - {server.base_url}")
+
+    rows = []
+    try:
+        for workers in (int(w) for w in args.workers.split(',')):
+            for batch_size in args.batch_sizes.split(','):
+                rows.append(run_scan(z, server, workdir, workers, batch_size, args))
+    finally:
+        server.stop()
+
+    print_table(rows)
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump({"args": vars(args), "runs": rows}, f, indent=4)
+    if baseline_path:
+        return 0 if compare(rows, baseline_path, args.tolerance) else 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""
+Línea de comandos de Zortify.
+
+    python cli.py [scan] [--account NOMBRE]       escanear las playlists (comando por defecto)
+    python cli.py show [--account NOMBRE] [--limit N]
+    python cli.py export [--account NOMBRE] [-o results.json] [--shards DIR [--shard-size N]]
+    python cli.py serve [--port 5000]
+    python cli.py migrate [--json results.json]   actualizar los almacenes al esquema actual
+    python cli.py coordinate [--workers N]        modo distribuido: reparte el escaneo
+    python cli.py worker                          modo distribuido: resuelve tareas
+
+show y export solo leen el almacén local: no importan Flask ni spotipy y
+nunca tocan la red. El resto importa zortify al ejecutarse.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+from typing import List, Optional
+
+def setup_logging():
+    """
+    Log a consola y a zortify.log (solo los comandos que escanean o sirven la
+    API) escrito desde un hilo de fondo. ZORTIFY_LOG_LEVEL cambia el nivel y
+    ZORTIFY_LOG_JSON agrega una copia en JSON lines con el contexto de cada evento.
+    """
+    from log_pipeline import setup_logging as start_log_pipeline
+    start_log_pipeline('zortify.log', os.getenv('ZORTIFY_LOG_JSON'),
+                       getattr(logging, os.getenv('ZORTIFY_LOG_LEVEL', 'INFO').upper(), logging.INFO))
+
+def account_names() -> Optional[List[str]]:
+    """Nombres de las cuentas de accounts.json, o None si se usa solo la cuenta del .env"""
+    path = os.getenv('ZORTIFY_ACCOUNTS', 'accounts.json')
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return [spec['name'] for spec in json.load(f)]
+
+def open_store(parser: argparse.ArgumentParser, account: Optional[str]):
+    """Almacén de la cuenta pedida, sin crearlo si todavía no hay resultados"""
+    from results_store import ResultsStore, store_paths
+    names = account_names()
+    if names is None:
+        if account not in (None, 'default'):
+            parser.error(f"Cuenta desconocida: {account} (no hay {os.getenv('ZORTIFY_ACCOUNTS', 'accounts.json')})")
+        paths = store_paths()
+    else:
+        if account is not None and account not in names:
+            parser.error(f"Cuenta desconocida: {account} (opciones: {', '.join(names)})")
+        paths = store_paths(account or names[0])
+    if not any(os.path.exists(path) for path in paths):
+        return None
+    return ResultsStore(*paths)
+
+def cmd_show(parser: argparse.ArgumentParser, args) -> int:
+    store = open_store(parser, args.account)
+    if store is None:
+        print("📂 No hay resultados todavía: ejecuta primero 'python cli.py scan'")
+        return 1
+    shown = 0
+    for name, details in store.iter_sorted():
+        if args.limit and shown >= args.limit:
+            break
+        duration = details['duration']
+        listened = '✓' if details.get('listened') else ' '
+        print(f"{duration['days']:3d}d {duration['hours']:02d}h {duration['minutes']:02d}m "
+              f"{duration['seconds']:02d}s  {details['total_tracks']:6d} tracks  {listened}  {name}")
+        shown += 1
+    print(f"📝 {shown} playlists")
+    return 0
+
+def cmd_export(parser: argparse.ArgumentParser, args) -> int:
+    store = open_store(parser, args.account)
+    if store is None:
+        print("📂 No hay resultados que exportar")
+        return 1
+    if args.shards:
+        manifest = store.export_shards(args.shards, args.shard_size)
+        print(f"✅ {manifest['total']} playlists en {len(manifest['shards'])} shards en {args.shards}")
+        return 0
+    store.export_json(args.output)
+    print(f"✅ Resultados exportados a {args.output or store.json_path}")
+    return 0
+
+def cmd_migrate(parser: argparse.ArgumentParser, args) -> int:
+    from migrations import SCHEMA_VERSION, migrate_json_file
+    from results_store import ResultsStore, store_paths
+    names = account_names()
+    # Abrir un almacén lo migra (y si solo hay results.json, lo importa migrando cada entrada)
+    for paths in ([store_paths()] if names is None else [store_paths(name) for name in names]):
+        if any(os.path.exists(path) for path in paths):
+            ResultsStore(*paths).flush()
+            print(f"✅ {paths[0]}: esquema v{SCHEMA_VERSION}")
+    if args.json_path:
+        changed = migrate_json_file(args.json_path)
+        print(f"✅ {args.json_path}: {changed} entradas actualizadas")
+    return 0
+
+def scan_accounts(parser: argparse.ArgumentParser, z, account: Optional[str]):
+    accounts = z.get_accounts()
+    if account is None:
+        return accounts
+    selected = [a for a in accounts if a.name == account]
+    if not selected:
+        parser.error(f"Cuenta desconocida: {account} (opciones: {', '.join(a.name for a in accounts)})")
+    return selected
+
+def cmd_scan(parser: argparse.ArgumentParser, args) -> int:
+    setup_logging()
+    import zortify as z
+    z.install_signal_handlers()
+    z.logger.info("🚀 Iniciando aplicación")
+    z.scan_all(scan_accounts(parser, z, args.account))
+    return 0
+
+def cmd_serve(parser: argparse.ArgumentParser, args) -> int:
+    setup_logging()
+    import zortify as z
+    z.install_signal_handlers()
+    z.logger.info(f"🌐 Sirviendo la API en http://localhost:{args.port}/api/playlists")
+    z.app.run(port=args.port, threaded=True)
+    return 0
+
+def cmd_coordinate(parser: argparse.ArgumentParser, args) -> int:
+    setup_logging()
+    import zortify as z
+    z.install_signal_handlers()
+    with z.profiled():
+        z.coordinate_scan(z.new_work_queue(), local_workers=args.workers,
+                          scan_accounts=scan_accounts(parser, z, args.account))
+    z.save_all_results()
+    z.log_metrics_summary()
+    return 0
+
+def cmd_worker(parser: argparse.ArgumentParser, args) -> int:
+    setup_logging()
+    import zortify as z
+    z.install_signal_handlers()
+    z.run_shard_worker(z.new_work_queue())
+    return 0
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='zortify', description="Duración de las playlists de Spotify")
+    commands = parser.add_subparsers(dest='command')
+
+    scan = commands.add_parser('scan', help="escanear las playlists nuevas o modificadas")
+    scan.add_argument('--account', help="escanear solo esta cuenta de accounts.json")
+    scan.set_defaults(handler=cmd_scan)
+
+    show = commands.add_parser('show', help="listar los resultados guardados, de mayor a menor duración")
+    show.add_argument('--account', help="cuenta de accounts.json (por defecto la primera)")
+    show.add_argument('--limit', type=int, default=0, help="mostrar solo las N más largas")
+    show.set_defaults(handler=cmd_show)
+
+    export = commands.add_parser('export', help="exportar los resultados guardados a results.json")
+    export.add_argument('--account', help="cuenta de accounts.json (por defecto la primera)")
+    export.add_argument('-o', '--output', help="archivo de salida (por defecto el results.json de la cuenta)")
+    export.add_argument('--shards', metavar='DIR',
+                        help="exportar en su lugar un manifest.json y shards con hash para el frontend estático")
+    export.add_argument('--shard-size', type=int, default=100, help="playlists por shard")
+    export.set_defaults(handler=cmd_export)
+
+    serve = commands.add_parser('serve', help="servir la API para el frontend")
+    serve.add_argument('--port', type=int, default=5000)
+    serve.set_defaults(handler=cmd_serve)
+
+    migrate = commands.add_parser('migrate', help="actualizar los almacenes de resultados al esquema actual")
+    migrate.add_argument('--json', dest='json_path', help="migrar también este results.json (en su lugar)")
+    migrate.set_defaults(handler=cmd_migrate)
+
+    coordinate = commands.add_parser('coordinate', help="repartir el escaneo entre procesos worker")
+    coordinate.add_argument('--workers', type=int, default=0, help="procesos worker a lanzar en esta máquina")
+    coordinate.add_argument('--account', help="escanear solo esta cuenta de accounts.json")
+    coordinate.set_defaults(handler=cmd_coordinate)
+
+    worker = commands.add_parser('worker', help="resolver tareas de un escaneo distribuido")
+    worker.set_defaults(handler=cmd_worker)
+    return parser
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        args = parser.parse_args(['scan'])
+    from dotenv import load_dotenv
+    load_dotenv()
+    return args.handler(parser, args)
+
+if __name__ == '__main__':
+    sys.exit(main())
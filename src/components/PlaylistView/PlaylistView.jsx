@@ -69,7 +69,7 @@ const PlaylistView = ({ playlists, searchTerm = '', isAnimating }) => {
             onClick={() => handlePlaylistClick(playlist.url)}
           >
             <div className="playlist-image">
-              <img src={playlist.image} alt={playlist.name} />
+              <img src={playlist.image} alt={playlist.name} loading="lazy" />
             </div>
             <div className="playlist-name">
               {playlist.name}
@@ -0,0 +1,79 @@
+import heapq
+import itertools
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+class FairQueue:
+    """
+    Cola de trabajo compartida por varias cuentas. Cada cuenta tiene su propia
+    cola de prioridad y get() atiende a la cuenta que menos trabajo recibió en
+    proporción a su peso (tiempo virtual, como en weighted fair queuing), así
+    una biblioteca enorme no deja esperando a las demás.
+    Una cuenta que vuelve a tener trabajo tras quedarse vacía no acumula crédito.
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._counter = itertools.count()  # Desempate estable dentro de cada cola
+        self._heaps: Dict[str, List[Tuple[float, int, float, Any]]] = {}
+        self._weights: Dict[str, float] = {}
+        self._served: Dict[str, float] = {}  # Trabajo recibido / peso
+        self._open = set()
+        self._stopped = False
+
+    def __len__(self) -> int:
+        with self._cond:
+            return sum(len(heap) for heap in self._heaps.values())
+
+    def register(self, key: str, weight: float = 1.0):
+        if weight <= 0:
+            raise ValueError(f"El peso de {key} debe ser positivo: {weight}")
+        with self._cond:
+            self._heaps[key] = []
+            self._weights[key] = weight
+            self._served[key] = 0.0
+            self._open.add(key)
+
+    def put(self, key: str, priority: float, cost: float, item: Any):
+        """Encola item para key; dentro de la cuenta sale primero la prioridad más baja"""
+        with self._cond:
+            if self._stopped:
+                return
+            heap = self._heaps[key]
+            if not heap:
+                busy = [self._served[k] for k, h in self._heaps.items() if h]
+                if busy:
+                    self._served[key] = max(self._served[key], min(busy))
+            heapq.heappush(heap, (priority, next(self._counter), cost, item))
+            self._cond.notify()
+
+    def close(self, key: str):
+        """La cuenta no va a encolar más trabajo"""
+        with self._cond:
+            self._open.discard(key)
+            self._cond.notify_all()
+
+    def shutdown(self):
+        """Descarta el trabajo pendiente y cierra todas las cuentas: get() devuelve None enseguida"""
+        with self._cond:
+            self._stopped = True
+            for heap in self._heaps.values():
+                heap.clear()
+            self._open.clear()
+            self._cond.notify_all()
+
+    def get(self) -> Optional[Tuple[str, Any]]:
+        """
+        Devuelve (key, item) de la cuenta más atrasada, esperando si hace falta.
+        Devuelve None cuando todas las cuentas cerraron y no queda trabajo.
+        """
+        with self._cond:
+            while True:
+                ready = [key for key, heap in self._heaps.items() if heap]
+                if ready:
+                    key = min(ready, key=lambda k: self._served[k])
+                    _, _, cost, item = heapq.heappop(self._heaps[key])
+                    self._served[key] += cost / self._weights[key]
+                    return key, item
+                if not self._open:
+                    return None
+                self._cond.wait()
@@ -0,0 +1,269 @@
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    image_key TEXT PRIMARY KEY,
+    url TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    content_type TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_files_last_used ON files(last_used);
+"""
+
+# Lados (en píxeles) de las miniaturas que se sirven; 0 es la imagen original
+THUMBNAIL_SIZES = (0, 64, 160, 300)
+DEFAULT_THUMBNAIL_SIZE = 160
+MAX_IMAGE_BYTES = 5 * 1024 * 1024
+
+_pil = None
+
+def pil_image():
+    """
+    Módulo PIL.Image, importado al primer uso (results_index.py importa este
+    módulo y solo la API de portadas lo necesita). Pillow es opcional: sin él
+    devuelve None y no hay miniaturas.
+    """
+    global _pil
+    if _pil is None:
+        try:
+            from PIL import Image
+            _pil = Image
+        except ImportError:
+            _pil = False
+    return _pil or None
+
+def image_key(url: str) -> str:
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()[:24]
+
+def thumbnail_path(url: Optional[str], size: int = DEFAULT_THUMBNAIL_SIZE) -> Optional[str]:
+    """Ruta local (relativa a la API) de la miniatura de una portada"""
+    if not url:
+        return None
+    return f'/api/covers/{image_key(url)}/{size}'
+
+class ImageCache:
+    """
+    Caché en disco de portadas: cada URL se descarga una sola vez (aunque la
+    pidan varios hilos a la vez) y de ella se generan las miniaturas.
+    Originales y miniaturas son archivos en root con un índice SQLite que
+    recuerda cuándo se usó cada uno; al pasar de max_bytes se borran los
+    menos usados. La URL de cada clave no se borra, así que una portada
+    desalojada se vuelve a bajar si alguien la pide.
+    Sin Pillow no hay miniaturas: solo se guardan los originales que se
+    piden con medida 0 y la API manda las demás a la portada del CDN.
+    """
+    def __init__(self, root: str = 'covers', max_bytes: int = 200 * 1024 * 1024, workers: int = 4,
+                 timeout: float = 10, http=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        os.makedirs(root, exist_ok=True)
+        if http is None:
+            import requests
+            http = requests.Session()
+            # Pocas conexiones al CDN: como mucho una por worker
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+            http.mount('https://', adapter)
+            http.mount('http://', adapter)
+        self.http = http
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='covers')
+        self._pending: List[Future] = []
+        self._inflight: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        if not self.can_resize:
+            logger.warning("⚠️ Pillow no está instalado: sin miniaturas, las portadas se piden al CDN")
+
+    @property
+    def can_resize(self) -> bool:
+        return pil_image() is not None
+
+    def _conn(self) -> sqlite3.Connection:
+        # Una conexión por hilo: piden portadas la API y los workers de descarga
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(os.path.join(self.root, 'index.db'), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _file_name(self, key: str, size: int) -> str:
+        return f'{key}-{size}'
+
+    # Índice
+
+    def register(self, urls: Iterable[Optional[str]]) -> Dict[str, str]:
+        """Da de alta las URLs (sin descargarlas) para poder servirlas por su clave"""
+        keys = {image_key(url): url for url in urls if url}
+        with self._conn() as conn:
+            conn.executemany("INSERT OR IGNORE INTO urls VALUES (?, ?)", keys.items())
+        return keys
+
+    def url_of(self, key: str) -> Optional[str]:
+        row = self._conn().execute("SELECT url FROM urls WHERE image_key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _read(self, name: str) -> Optional[Tuple[bytes, str]]:
+        row = self._conn().execute("SELECT content_type FROM files WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        try:
+            with open(os.path.join(self.root, name), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        with self._conn() as conn:
+            conn.execute("UPDATE files SET last_used = ? WHERE name = ?", (time.time(), name))
+        return data, row[0]
+
+    def _write(self, name: str, data: bytes, content_type: str):
+        path = os.path.join(self.root, name)
+        tmp_path = f'{path}.tmp-{threading.get_ident()}'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", (name, content_type, len(data), time.time()))
+        self._evict()
+
+    def _evict(self):
+        """Borra los archivos menos usados hasta volver a entrar en max_bytes"""
+        conn = self._conn()
+        total = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM files").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for name, size in conn.execute("SELECT name, bytes FROM files ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.root, name))
+            except FileNotFoundError:
+                pass
+            evicted.append((name,))
+            total -= size
+        with conn:
+            conn.executemany("DELETE FROM files WHERE name = ?", evicted)
+        logger.info(f"🧹 Caché de portadas: {len(evicted)} archivos desalojados")
+
+    # Descarga y miniaturas
+
+    def _download(self, key: str, url: str) -> Optional[Tuple[bytes, str]]:
+        response = self.http.get(url, timeout=self.timeout)
+        content_type = response.headers.get('Content-Type', '').split(';')[0]
+        if response.status_code != 200 or not content_type.startswith('image/'):
+            logger.warning(f"⚠️ No se pudo descargar la portada {url}: {response.status_code} {content_type}")
+            return None
+        if len(response.content) > MAX_IMAGE_BYTES:
+            logger.warning(f"⚠️ Portada demasiado grande, se ignora: {url}")
+            return None
+        self._write(self._file_name(key, 0), response.content, content_type)
+        return response.content, content_type
+
+    def _original(self, key: str) -> Optional[Tuple[bytes, str]]:
+        """Original de la portada; si no está se descarga, una sola vez aunque la pidan varios hilos"""
+        while True:
+            found = self._read(self._file_name(key, 0))
+            if found is not None:
+                return found
+            with self._lock:
+                event = self._inflight.get(key)
+                if event is None:
+                    event = self._inflight[key] = threading.Event()
+                    owner = True
+                else:
+                    owner = False
+            if not owner:
+                event.wait(self.timeout * 2)
+                if self._read(self._file_name(key, 0)) is None:
+                    return None  # La descarga de otro hilo falló
+                continue
+            try:
+                url = self.url_of(key)
+                return self._download(key, url) if url else None
+            except Exception as e:
+                logger.warning(f"⚠️ Error descargando la portada {key}: {str(e)}")
+                return None
+            finally:
+                with self._lock:
+                    del self._inflight[key]
+                event.set()
+
+    def get(self, key: str, size: int = DEFAULT_THUMBNAIL_SIZE) -> Optional[Tuple[bytes, str, int]]:
+        """
+        (bytes, content type, medida servida) de la miniatura; None si la clave
+        no es de una portada conocida. La medida servida es 0 cuando no se pudo
+        redimensionar (sin Pillow o con una imagen que Pillow no abre) y se
+        devuelve el original.
+        """
+        if size not in THUMBNAIL_SIZES:
+            raise ValueError(f"Tamaño no válido: {size} (opciones: {', '.join(map(str, THUMBNAIL_SIZES))})")
+        if size != 0 and pil_image() is not None:
+            found = self._read(self._file_name(key, size))
+            if found is not None:
+                return (*found, size)
+        original = self._original(key)
+        if original is None:
+            return None
+        if size == 0 or pil_image() is None:
+            return (*original, 0)
+        thumbnail = self._resize(original[0], size)
+        if thumbnail is None:
+            return (*original, 0)
+        self._write(self._file_name(key, size), thumbnail, 'image/jpeg')
+        return thumbnail, 'image/jpeg', size
+
+    def _resize(self, data: bytes, size: int) -> Optional[bytes]:
+        try:
+            with pil_image().open(io.BytesIO(data)) as image:
+                image = image.convert('RGB')
+                image.thumbnail((size, size))
+                out = io.BytesIO()
+                image.save(out, 'JPEG', quality=82, optimize=True)
+                return out.getvalue()
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo redimensionar una portada: {str(e)}")
+            return None
+
+    def prefetch(self, urls: Iterable[Optional[str]], size: int = DEFAULT_THUMBNAIL_SIZE) -> int:
+        """
+        Registra las portadas y descarga en segundo plano las que no estén en
+        caché, dejando lista su miniatura. Devuelve cuántas encoló (ninguna
+        sin Pillow: no habría miniatura que servir).
+        """
+        keys = list(self.register(urls))
+        if not self.can_resize:
+            return 0
+        missing = []
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            names = [self._file_name(key, size) for key in chunk]
+            cached = {row[0] for row in self._conn().execute(
+                f"SELECT name FROM files WHERE name IN ({','.join('?' * len(names))})", names
+            )}
+            missing.extend(key for key, name in zip(chunk, names) if name not in cached)
+        with self._lock:
+            self._pending = [f for f in self._pending if not f.done()]
+            self._pending.extend(self._executor.submit(self.get, key, size) for key in missing)
+        return len(missing)
+
+    def drain(self):
+        """Espera a que terminen las descargas encoladas con prefetch"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for future in pending:
+            future.exception()
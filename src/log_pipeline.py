@@ -0,0 +1,112 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Hashable, List, Optional
+
+HUMAN_FORMAT = '%(asctime)s [%(levelname)s] %(message)s'
+
+# Campos de contexto que los llamadores pasan con extra={...} y que van al JSON
+CONTEXT_FIELDS = ('account', 'playlist_id', 'offset', 'suppressed')
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Encola el registro tal cual: el mensaje se arma (msg % args) en el hilo
+    del listener, no en el worker que loguea. Por eso los argumentos deben ser
+    valores que no cambien después (números, strings). La cola ya es segura
+    entre hilos, así que el handler no necesita su propio lock.
+    """
+    def handle(self, record: logging.LogRecord) -> bool:
+        if not self.filter(record):
+            return False
+        self.emit(record)
+        return True
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            # La traza no se puede formatear después: sus frames ya no existirían
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+class JsonLinesFormatter(logging.Formatter):
+    """Un objeto JSON por línea con el contexto estructurado (cuenta, playlist, offset)"""
+    def format(self, record: logging.LogRecord) -> str:
+        event = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage()
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                event[field] = value
+        if record.exc_text:
+            event["exc"] = record.exc_text
+        return json.dumps(event, ensure_ascii=False)
+
+def setup_logging(log_path: Optional[str] = 'zortify.log', json_path: Optional[str] = None,
+                  level: int = logging.INFO) -> logging.handlers.QueueListener:
+    """
+    Configura el log del proceso: los hilos solo encolan registros y un hilo
+    de fondo los escribe en consola, en log_path y, si se indica, en json_path
+    (JSON lines). La cola se vacía al salir del proceso.
+    """
+    # Sin archivo ni línea en el formato no hace falta recorrer la pila por cada registro
+    logging._srcfile = None
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    handlers: List[logging.Handler] = [logging.StreamHandler()]
+    if log_path:
+        handlers.append(logging.FileHandler(log_path, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(logging.Formatter(HUMAN_FORMAT))
+    if json_path:
+        json_handler = logging.FileHandler(json_path, encoding='utf-8')
+        json_handler.setFormatter(JsonLinesFormatter())
+        handlers.append(json_handler)
+
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(records))
+    root.setLevel(level)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+class Sampler:
+    """
+    Deja pasar como mucho un evento por clave cada interval segundos, para
+    eventos que pueden repetirse miles de veces (un track saltado, un 429).
+    sample() devuelve cuántos eventos de esa clave se descartaron desde el
+    último que pasó, o None si este también se descarta.
+    """
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self._next_at: Dict[Hashable, float] = {}
+        self._suppressed: Dict[Hashable, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def sample(self, key: Hashable = None) -> Optional[int]:
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_at.get(key, 0.0):
+                self._suppressed[key] += 1
+                return None
+            self._next_at[key] = now + self.interval
+            return self._suppressed.pop(key, 0)
+
+    def forget(self, key: Hashable):
+        with self._lock:
+            self._next_at.pop(key, None)
+            self._suppressed.pop(key, None)
@@ -0,0 +1,256 @@
+import bisect
+import collections
+import sys
+import threading
+import time
+from contextlib import nullcontext
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Límites (en segundos) de los histogramas de latencia
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_NULL_TIMER = nullcontext()
+
+class Registry:
+    """
+    Registro de métricas. Mientras está desactivado cada inc/observe/time es
+    una comprobación de un booleano y nada más, así que la instrumentación
+    puede quedarse en el código sin costo.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.metrics: List['Metric'] = []
+
+    def render(self) -> str:
+        """Todas las métricas en el formato de texto de Prometheus"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> List[str]:
+        """Resumen legible de las métricas con datos, para el final del escaneo"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.summary())
+        return lines
+
+REGISTRY = Registry()
+
+def enable(enabled: bool = True):
+    REGISTRY.enabled = enabled
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Metric:
+    kind = ''
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), registry: Registry = REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.registry = registry
+        self._lock = threading.Lock()
+        registry.metrics.append(self)
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        """Líneas en formato Prometheus; sin datos, ninguna"""
+        return []
+
+    def summary(self) -> List[str]:
+        """Líneas del resumen final; las métricas que no lo necesitan (como Gauge) no muestran nada"""
+        return []
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple, float] = collections.defaultdict(float)
+
+    def inc(self, amount: float = 1, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [f'{self.name}{_format_labels(self.labelnames, key)} {value}'
+                    for key, value in sorted(self._values.items())]
+
+    def summary(self) -> List[str]:
+        with self._lock:
+            return [f'{self.name}{_format_labels(self.labelnames, key)}: {value:g}'
+                    for key, value in sorted(self._values.items())]
+
+class Gauge(Metric):
+    """Valor instantáneo; con fn se calcula al leerlo (por ejemplo, el largo de una cola)"""
+    kind = 'gauge'
+
+    def __init__(self, *args, fn: Optional[Callable[[], float]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fn = fn
+        self._values: Dict[Tuple, float] = {}
+
+    def set(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _read(self) -> Dict[Tuple, float]:
+        if self.fn is not None:
+            return {(): self.fn()}
+        with self._lock:
+            return dict(self._values)
+
+    def samples(self) -> List[str]:
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {value}'
+                for key, value in sorted(self._read().items())]
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, *args, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = buckets
+        # etiquetas -> [conteo por bucket (+Inf al final), suma, cantidad]
+        self._series: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels):
+        """Context manager que observa la duración del bloque"""
+        if not self.registry.enabled:
+            return _NULL_TIMER
+        return _Timer(self, labels)
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                labels = _format_labels(self.labelnames, key, f'le="{le}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {count}')
+        return lines
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """Cuantil aproximado: el límite superior del bucket donde cae"""
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            if series is None:
+                return None
+            counts, count = series[0][:], series[2]
+        target = q * count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return bound
+        return None
+
+    def summary(self) -> List[str]:
+        lines = []
+        with self._lock:
+            series = sorted((key, total, count) for key, (_, total, count) in self._series.items())
+        for key, total, count in series:
+            labels = dict(zip(self.labelnames, key))
+            p50, p95 = self.quantile(0.5, **labels), self.quantile(0.95, **labels)
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)}: {count} obs, total {total:.3f}s, '
+                         f'media {total / count:.3f}s, p50 <= {p50:g}s, p95 <= {p95:g}s')
+        return lines
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram: Histogram, labels: Dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+class SamplingProfiler:
+    """
+    Perfilador por muestreo: cada interval segundos toma la pila de todos los
+    hilos y cuenta las pilas repetidas. Mide tiempo de pared, así que también
+    se ve el tiempo que los workers pasan esperando al limitador o a la red. write() las guarda en formato
+    "collapsed" (una línea por pila, funciones separadas por ';' y el conteo
+    al final), que leen flamegraph.pl y speedscope.
+    """
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks: Dict[str, int] = collections.Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({code.co_filename.rsplit("/", 1)[-1]}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def top(self, n: int = 10) -> List[Tuple[str, int]]:
+        """Las funciones donde más muestras se vieron (la cima de cada pila)"""
+        leaves = collections.Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        return leaves.most_common(n)
+
+    def write(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f'{stack} {count}\n')
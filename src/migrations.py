@@ -0,0 +1,137 @@
+import json
+import logging
+import sqlite3
+from typing import Callable, Dict, NamedTuple, Optional
+
+from results_json import iter_results, write_results
+
+logger = logging.getLogger(__name__)
+
+class Migration(NamedTuple):
+    """
+    Un paso del esquema de resultados. upgrade_db cambia la estructura de la
+    base y upgrade_entry corrige una entrada en su lugar (devuelve True si la
+    cambió). Los dos deben ser idempotentes: aplicarlos otra vez no cambia nada.
+    """
+    version: int
+    description: str
+    upgrade_db: Optional[Callable[[sqlite3.Connection], None]] = None
+    upgrade_entry: Optional[Callable[[Dict], bool]] = None
+
+def _add_track_id_column(conn: sqlite3.Connection):
+    # Bases creadas antes de que se guardaran los ids de los tracks
+    if 'track_id' not in {row[1] for row in conn.execute("PRAGMA table_info(track_pages)")}:
+        conn.execute("ALTER TABLE track_pages ADD COLUMN track_id BLOB NOT NULL DEFAULT X''")
+
+def _add_checkpoint_page_size(conn: sqlite3.Connection):
+    # Hasta ahora todas las páginas eran de 50 tracks; ahora el tamaño cambia según el planificador
+    if 'page_size' not in {row[1] for row in conn.execute("PRAGMA table_info(checkpoints)")}:
+        conn.execute("ALTER TABLE checkpoints ADD COLUMN page_size INTEGER NOT NULL DEFAULT 50")
+
+def _add_listened(entry: Dict) -> bool:
+    # Lo que hacía overwriter.py, sin pisar las marcas que ya existen
+    if 'listened' in entry:
+        return False
+    entry['listened'] = False
+    return True
+
+def _podcasts_to_invalid_tracks(entry: Dict) -> bool:
+    # Las entradas antiguas solo contaban los podcasts descartados y se escribían al terminar la playlist
+    if 'podcasts_filtered' not in entry and 'processing_complete' in entry:
+        return False
+    podcasts = entry.pop('podcasts_filtered', 0)
+    entry.setdefault('invalid_tracks', podcasts)
+    entry.setdefault('processing_complete', True)
+    return True
+
+def _drop_thumbnail(entry: Dict) -> bool:
+    # La ruta de la miniatura es relativa a la API (la agrega ResultsIndex): en
+    # results.json y los shards de un hosting estático sería un 404
+    return entry.pop('thumbnail', None) is not None
+
+MIGRATIONS = [
+    Migration(1, "columna track_id en track_pages", upgrade_db=_add_track_id_column),
+    Migration(2, "marca listened en cada playlist", upgrade_entry=_add_listened),
+    Migration(3, "podcasts_filtered pasa a invalid_tracks y processing_complete", upgrade_entry=_podcasts_to_invalid_tracks),
+    Migration(4, "sin ruta thumbnail en las entradas", upgrade_entry=_drop_thumbnail),
+    Migration(5, "tamaño de página en los checkpoints", upgrade_db=_add_checkpoint_page_size),
+]
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+def migrate_entry(entry: Dict, from_version: int = 0) -> bool:
+    """Aplica a una entrada los pasos posteriores a from_version; devuelve True si cambió"""
+    changed = False
+    for migration in MIGRATIONS:
+        if migration.version > from_version and migration.upgrade_entry:
+            changed = migration.upgrade_entry(entry) or changed
+    return changed
+
+def store_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def upgrade_store(conn: sqlite3.Connection, new: bool = False, batch_size: int = 500):
+    """
+    Lleva la base de resultados a SCHEMA_VERSION. Todo ocurre en una sola
+    transacción junto con el sello de versión (PRAGMA user_version): los
+    lectores ven la base anterior o la migrada, y si el proceso muere a mitad
+    no queda nada a medias. Las entradas se recorren de a batch_size por
+    rowid, así la memoria no depende del tamaño de la base.
+    Una base nueva (new) ya se creó con el esquema actual y solo se sella.
+    """
+    if new:
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        return
+    if store_version(conn) >= SCHEMA_VERSION:
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Otro proceso pudo haber migrado mientras esperábamos el lock
+        version = store_version(conn)
+        pending = [m for m in MIGRATIONS if m.version > version]
+        for migration in pending:
+            if migration.upgrade_db:
+                logger.info(f"🛠️ Migración {migration.version}: {migration.description}")
+                migration.upgrade_db(conn)
+        updated = 0
+        if any(m.upgrade_entry for m in pending):
+            last_rowid = 0
+            while True:
+                rows = conn.execute(
+                    "SELECT rowid, data FROM playlists WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last_rowid, batch_size)
+                ).fetchall()
+                if not rows:
+                    break
+                changes = []
+                for rowid, data in rows:
+                    entry = json.loads(data)
+                    if migrate_entry(entry, version):
+                        changes.append((json.dumps(entry, ensure_ascii=False), rowid))
+                conn.executemany("UPDATE playlists SET data = ? WHERE rowid = ?", changes)
+                updated += len(changes)
+                last_rowid = rows[-1][0]
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    logger.info(f"✅ Esquema de resultados v{version} -> v{SCHEMA_VERSION} ({updated} playlists actualizadas)")
+
+def migrate_json_file(path: str) -> int:
+    """
+    Migra un results.json en su lugar, en streaming y de forma atómica.
+    El archivo no lleva sello de versión (sus claves son las playlists), así
+    que se aplican todos los pasos; como son idempotentes, repetirlo no cambia
+    nada. Devuelve cuántas entradas cambiaron.
+    """
+    changed = 0
+
+    def migrated():
+        nonlocal changed
+        for name, entry in iter_results(path):
+            if migrate_entry(entry):
+                changed += 1
+            yield name, entry
+
+    write_results(path, migrated())
+    return changed
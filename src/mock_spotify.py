@@ -0,0 +1,287 @@
+import json
+import random
+import re
+import struct
+import zlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+class MockLibrary:
+    """
+    Biblioteca sintética de playlists. Los tracks se generan al vuelo de forma
+    determinista a partir de la semilla, así una biblioteca grande no ocupa memoria.
+    """
+    def __init__(self, playlists: int = 20, tracks: int = 200, spread: float = 0.5,
+                 episode_ratio: float = 0.02, unplayable_ratio: float = 0.02,
+                 null_ratio: float = 0.01, seed: int = 0):
+        self.seed = seed
+        self.episode_ratio = episode_ratio
+        self.unplayable_ratio = unplayable_ratio
+        self.null_ratio = null_ratio
+        rng = random.Random(seed)
+        self.totals = [
+            max(1, int(tracks * rng.uniform(1 - spread, 1 + spread)))
+            for _ in range(playlists)
+        ]
+
+    def playlist_id(self, index: int) -> str:
+        return f'mock{index:06d}'
+
+    def playlist(self, index: int, base_url: str) -> Dict:
+        playlist_id = self.playlist_id(index)
+        return {
+            "id": playlist_id,
+            "name": f"Playlist {index}",
+            "snapshot_id": f"snap-{self.seed}-{index}",
+            "tracks": {"total": self.totals[index]},
+            "external_urls": {"spotify": f"https://open.spotify.com/playlist/{playlist_id}"},
+            "images": [{"url": f"{base_url}/images/{playlist_id}.jpg"}]
+        }
+
+    def item(self, index: int, position: int) -> Dict:
+        rng = random.Random(f'{self.seed}:{index}:{position}')
+        roll = rng.random()
+        if roll < self.null_ratio:
+            return {"track": None}
+        roll -= self.null_ratio
+        if roll < self.episode_ratio:
+            return {"track": {"duration_ms": rng.randint(600_000, 5_400_000), "is_playable": True,
+                              "type": "episode", "name": f"Episodio {position}"}}
+        roll -= self.episode_ratio
+        return {"track": {
+            "id": f't{rng.randint(0, 10 * sum(self.totals)):09d}',
+            "duration_ms": rng.randint(90_000, 420_000),
+            "is_playable": roll >= self.unplayable_ratio,
+            "type": "track",
+            "name": f"Track {position}",
+            "track_number": position % 20 + 1,
+            "album": {"album_type": rng.choice(("album", "album", "album", "single", "compilation"))}
+        }}
+
+    @lru_cache(maxsize=256)
+    def cover(self, index: int, size: int = 640) -> bytes:
+        """Portada PNG de la playlist: un degradado con ruido de su color, del tamaño de las del CDN"""
+        rng = random.Random(self.seed * 1_000_003 + index)
+        base = [rng.randrange(256) for _ in range(3)]
+        noise = bytes((base[i % 3] + byte % 16) % 256 for i, byte in enumerate(rng.randbytes(size * 3)))
+        rows = []
+        for y in range(size):
+            # Cada fila es la de ruido desplazada y aclarada según la altura
+            shift = 3 * rng.randrange(size)
+            shade = y * 128 // size
+            row = (noise[shift:] + noise[:shift]).translate(bytes(min(v + shade, 255) for v in range(256)))
+            rows.append(b'\x00' + row)  # Filtro PNG "None" en cada fila
+
+        def chunk(kind: bytes, data: bytes) -> bytes:
+            return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+        return (b'\x89PNG\r\n\x1a\n'
+                + chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0))
+                + chunk(b'IDAT', zlib.compress(b''.join(rows), 6))
+                + chunk(b'IEND', b''))
+
+    def index_of(self, playlist_id: str) -> Optional[int]:
+        try:
+            index = int(playlist_id[len('mock'):])
+        except ValueError:
+            return None
+        return index if 0 <= index < len(self.totals) else None
+
+def parse_fields(spec: str) -> Dict:
+    """
+    Árbol del parámetro fields de la API ("items(track(id,album(album_type))),total"):
+    cada campo apunta a su subárbol, o a None si se pide entero.
+    """
+    tokens = re.findall(r'[^(),]+|[(),]', spec.replace(' ', ''))
+    pos = 0
+
+    def parse_level() -> Dict:
+        nonlocal pos
+        tree = {}
+        while pos < len(tokens) and tokens[pos] != ')':
+            if tokens[pos] == ',':
+                pos += 1
+                continue
+            name = tokens[pos]
+            pos += 1
+            tree[name] = None
+            if pos < len(tokens) and tokens[pos] == '(':
+                pos += 1
+                tree[name] = parse_level()
+                pos += 1  # ')'
+        return tree
+
+    return parse_level()
+
+def project(value, tree: Optional[Dict]):
+    """Deja de value solo los campos del árbol de fields (las listas se proyectan elemento a elemento)"""
+    if tree is None:
+        return value
+    if isinstance(value, list):
+        return [project(v, tree) for v in value]
+    if isinstance(value, dict):
+        return {k: project(value[k], sub) for k, sub in tree.items() if k in value}
+    return value
+
+class FaultInjector:
+    """
+    Decide la latencia y las respuestas de error de cada petición: latencia
+    log-normal alrededor de la mediana, 429 con Retry-After y ráfagas de 5xx.
+    """
+    def __init__(self, latency_ms: float = 50.0, jitter: float = 0.5, rate_429: float = 0.0,
+                 retry_after: int = 1, error_5xx: float = 0.0, burst: int = 3, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.error_5xx = error_5xx
+        self.burst = burst
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._burst_left = 0
+
+    def decide(self) -> Tuple[float, int, Dict[str, str]]:
+        with self._lock:
+            delay = self.latency_ms / 1000 * self._rng.lognormvariate(0, self.jitter) if self.latency_ms else 0
+            if self._burst_left > 0:
+                self._burst_left -= 1
+                return delay, 503, {}
+            if self._rng.random() < self.error_5xx:
+                self._burst_left = self.burst - 1
+                return delay, 503, {}
+            if self._rng.random() < self.rate_429:
+                return delay, 429, {"Retry-After": str(self.retry_after)}
+            return delay, 200, {}
+
+class MockSpotifyServer:
+    """
+    Servidor HTTP local que imita /v1/me/playlists y /v1/playlists/{id}/tracks
+    (también /items, que es lo que usa spotipy) sobre una MockLibrary,
+    respetando el parámetro fields, y cuenta los bytes enviados. También
+    sirve las portadas en /images/{id}.jpg en lugar del CDN, sin fallos
+    inyectados y contadas aparte en stats["images"].
+    """
+    def __init__(self, library: MockLibrary, faults: Optional[FaultInjector] = None,
+                 host: str = '127.0.0.1', port: int = 0):
+        self.library = library
+        self.faults = faults or FaultInjector(latency_ms=0)
+        self.stats = {"requests": 0, "429": 0, "5xx": 0, "bytes": 0, "images": 0}
+        self._stats_lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self._server.serve_forever, name='mock-spotify', daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self, status: int):
+        with self._stats_lock:
+            self.stats["requests"] += 1
+            if status == 429:
+                self.stats["429"] += 1
+            elif status >= 500:
+                self.stats["5xx"] += 1
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, como la API real
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                limit = int(query.get('limit', ['50'])[0])
+                offset = int(query.get('offset', ['0'])[0])
+                parts = url.path.strip('/').split('/')
+                if len(parts) == 2 and parts[0] == 'images':
+                    return self._send_image(parts[1])
+
+                delay, status, headers = server.faults.decide()
+                time.sleep(delay)
+                if status != 200:
+                    server._count(status)
+                    return self._send(status, {"error": {"status": status, "message": "injected"}}, headers)
+
+                if parts[:3] == ['v1', 'me', 'playlists']:
+                    body = server._listing(offset, limit)
+                elif len(parts) == 4 and parts[:2] == ['v1', 'playlists'] and parts[3] in ('tracks', 'items'):
+                    body = server._items(parts[2], offset, limit)
+                    if body is not None and 'fields' in query:
+                        body = project(body, parse_fields(query['fields'][0]))
+                else:
+                    body = None
+                if body is None:
+                    server._count(404)
+                    return self._send(404, {"error": {"status": 404, "message": "Not found"}})
+                server._count(200)
+                self._send(200, body)
+
+            def _send_image(self, name: str):
+                index = server.library.index_of(name.rsplit('.', 1)[0])
+                if index is None:
+                    return self._send(404, {"error": {"status": 404, "message": "Not found"}})
+                with server._stats_lock:
+                    server.stats["images"] += 1
+                payload = server.library.cover(index)
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/png')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _send(self, status: int, body: Dict, headers: Optional[Dict[str, str]] = None):
+                payload = json.dumps(body).encode('utf-8')
+                with server._stats_lock:
+                    server.stats["bytes"] += len(payload)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+    def _page(self, path: str, offset: int, limit: int, total: int, items) -> Dict:
+        next_offset = offset + limit
+        return {
+            "href": f'{self.base_url}{path}?offset={offset}&limit={limit}',
+            "items": items,
+            "limit": limit,
+            "offset": offset,
+            "total": total,
+            "next": f'{self.base_url}{path}?offset={next_offset}&limit={limit}' if next_offset < total else None
+        }
+
+    def _listing(self, offset: int, limit: int) -> Dict:
+        total = len(self.library.totals)
+        items = [self.library.playlist(i, self.base_url) for i in range(offset, min(total, offset + limit))]
+        return self._page('/v1/me/playlists', offset, limit, total, items)
+
+    def _items(self, playlist_id: str, offset: int, limit: int) -> Optional[Dict]:
+        index = self.library.index_of(playlist_id)
+        if index is None:
+            return None
+        total = self.library.totals[index]
+        items = [self.library.item(index, p) for p in range(offset, min(total, offset + limit))]
+        return self._page(f'/v1/playlists/{playlist_id}/tracks', offset, limit, total, items)
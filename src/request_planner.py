@@ -0,0 +1,149 @@
+import logging
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAX_PAGE_SIZE = 100  # Máximo de items por página de playlist_items
+
+# Campos de cada track que necesita cada agregación; 'totals' (duración y
+# tracks válidos/inválidos) siempre está activa
+AGGREGATION_FIELDS = {
+    'totals': ('duration_ms', 'is_playable', 'type'),
+    'track_stats': ('album(album_type)',),
+    'overlap': ('id',),
+}
+
+def track_fields(aggregations: Iterable[str]) -> str:
+    """Proyección (parámetro fields) de las páginas de tracks con solo lo que usan las agregaciones"""
+    fields = list(AGGREGATION_FIELDS['totals'])
+    for name in aggregations:
+        if name not in AGGREGATION_FIELDS:
+            raise ValueError(f"Agregación desconocida: {name} (opciones: {', '.join(AGGREGATION_FIELDS)})")
+        fields.extend(field for field in AGGREGATION_FIELDS[name] if field not in fields)
+    # total sirve para detectar si la playlist creció desde el listado
+    return f"items(track({','.join(fields)})),total"
+
+def uncovered_ranges(total: int, completed: Dict[int, int], start: int = 0) -> List[Tuple[int, int]]:
+    """
+    Tramos [inicio, fin) de la playlist a partir de start que no cubre
+    ninguna página completada (completed: offset -> tamaño de la página).
+    """
+    ranges = []
+    cursor = start
+    for offset in sorted(completed):
+        if offset > cursor:
+            ranges.append((cursor, min(offset, total)))
+        cursor = max(cursor, offset + completed[offset])
+    if cursor < total:
+        ranges.append((cursor, total))
+    return [(begin, end) for begin, end in ranges if begin < end]
+
+def overlaps(completed: Dict[int, int], offset: int, size: int) -> bool:
+    """Si la página [offset, offset + size) se pisa con alguna ya completada"""
+    return any(other < offset + size and offset < other + other_size for other, other_size in completed.items())
+
+class PageCursor:
+    """
+    Tramos pendientes de una playlist que se van cortando en páginas al
+    pedirlas, cada una del tamaño que indique el planificador en ese momento.
+    """
+    def __init__(self, ranges: Iterable[Tuple[int, int]]):
+        self._ranges = deque(ranges)
+
+    def __bool__(self) -> bool:
+        return bool(self._ranges)
+
+    def next_page(self, page_size: int) -> Optional[Tuple[int, int]]:
+        """(offset, limit) de la próxima página, o None si no queda nada"""
+        if not self._ranges:
+            return None
+        begin, end = self._ranges[0]
+        limit = min(page_size, end - begin)
+        if begin + limit >= end:
+            self._ranges.popleft()
+        else:
+            self._ranges[0] = (begin + limit, end)
+        return begin, limit
+
+    def pages_left(self, page_size: int) -> int:
+        return sum(-(-(end - begin) // page_size) for begin, end in self._ranges)
+
+    def extend(self, begin: int, end: int):
+        """Agrega un tramo al final (la playlist creció desde el listado)"""
+        if begin < end:
+            self._ranges.append((begin, end))
+
+class PagePlanner:
+    """
+    Elige el tamaño de página de una cuenta a partir de lo que miden sus
+    propias páginas: segundos por item (promedio móvil exponencial) y 429s
+    recientes. Cada window páginas apunta al tamaño más grande cuya latencia
+    estimada entra en latency_budget, creciendo como mucho al doble por vez.
+    Menos páginas son menos peticiones, así que mientras la fracción de 429
+    supera throttle_budget no se achica (el ritmo lo baja el limitador).
+    Sin adaptive se usa siempre page_size, como para grabar o reproducir la
+    caché de la API, cuyas claves incluyen el tamaño.
+    """
+    def __init__(self, page_size: int = MAX_PAGE_SIZE, min_size: int = 20, max_size: int = MAX_PAGE_SIZE,
+                 latency_budget: float = 2.0, throttle_budget: float = 0.05, adaptive: bool = True,
+                 window: int = 10, smoothing: float = 0.2):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.page_size = max(min_size, min(max_size, page_size))
+        self.latency_budget = latency_budget
+        self.throttle_budget = throttle_budget
+        self.adaptive = adaptive
+        self.window = window
+        self.smoothing = smoothing
+        self.seconds_per_item: Optional[float] = None
+        self.stats = {'pages': 0, 'items': 0, 'bytes': 0, 'seconds': 0.0, 'throttled': 0, 'resizes': 0}
+        self._window_pages = 0
+        self._window_throttled = 0
+        self._lock = threading.Lock()
+
+    def record(self, items: int, seconds: float, received_bytes: int):
+        """Registra una página recibida: items devueltos, latencia y bytes de la respuesta"""
+        with self._lock:
+            self.stats['pages'] += 1
+            self.stats['items'] += items
+            self.stats['bytes'] += received_bytes
+            self.stats['seconds'] += seconds
+            if items:
+                sample = seconds / items
+                self.seconds_per_item = (sample if self.seconds_per_item is None else
+                                         self.seconds_per_item + self.smoothing * (sample - self.seconds_per_item))
+            self._window_pages += 1
+            if self._window_pages >= self.window:
+                self._adjust()
+
+    def record_throttle(self):
+        with self._lock:
+            self.stats['throttled'] += 1
+            self._window_throttled += 1
+
+    def _adjust(self):
+        throttle_ratio = self._window_throttled / (self._window_pages + self._window_throttled)
+        self._window_pages = self._window_throttled = 0
+        if not self.adaptive or not self.seconds_per_item:
+            return
+        target = int(self.latency_budget / self.seconds_per_item)
+        target = max(self.min_size, min(self.max_size, target, self.page_size * 2))
+        if target < self.page_size and throttle_ratio > self.throttle_budget:
+            return
+        if target != self.page_size:
+            logger.info("📐 Tamaño de página %d -> %d (%.1f ms por item, %.0f%% de 429)", self.page_size, target,
+                        self.seconds_per_item * 1000, throttle_ratio * 100)
+            self.page_size = target
+            self.stats['resizes'] += 1
+
+    def summary(self) -> Dict:
+        with self._lock:
+            pages = self.stats['pages']
+            return {
+                **self.stats,
+                'page_size': self.page_size,
+                'bytes_per_item': round(self.stats['bytes'] / self.stats['items'], 1) if self.stats['items'] else 0.0,
+                'mean_page_seconds': round(self.stats['seconds'] / pages, 3) if pages else 0.0
+            }
@@ -0,0 +1,199 @@
+import base64
+import bisect
+import binascii
+import hashlib
+import json
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from image_cache import thumbnail_path
+from results_store import ResultsStore, duration_seconds
+from search_index import SearchIndex
+from track_store import TrackColumns, library_overlap, track_stats
+
+logger = logging.getLogger(__name__)
+
+SORT_KEYS = {
+    'duration': lambda entry: duration_seconds(entry['duration']),
+    'tracks': lambda entry: entry['total_tracks'],
+}
+
+# Los pares con menos tracks en común no se guardan
+OVERLAP_MIN_JACCARD = 0.05
+
+class InvalidQueryError(ValueError):
+    """Parámetros de consulta no válidos (orden, filtro o cursor)"""
+
+class OverlapUnavailableError(LookupError):
+    """Los tracks guardados no tienen ids (se escanearon sin la agregación overlap)"""
+
+def encode_cursor(key: int, playlist_id: str) -> str:
+    raw = json.dumps([key, playlist_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor: str) -> Tuple[int, str]:
+    try:
+        key, playlist_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return int(key), str(playlist_id)
+    except (binascii.Error, ValueError, TypeError, UnicodeDecodeError):
+        raise InvalidQueryError(f"Cursor no válido: {cursor}")
+
+class ResultsIndex:
+    """
+    Índice en memoria de los resultados para la API. Se carga una vez del
+    almacén y se recarga solo cuando el almacén cambia. Cada combinación de
+    orden y filtro se materializa la primera vez que se pide y la paginación
+    usa cursores por clave (valor de orden + id), estables entre recargas.
+    El índice de búsqueda por nombre solo recibe las playlists que cambiaron.
+    """
+    def __init__(self, store: ResultsStore):
+        self.store = store
+        self._lock = threading.Lock()
+        self._token = None
+        # Huella del contenido cargado: la misma en cualquier proceso que vea los mismos datos
+        self.fingerprint = ''
+        self.entries: List[Dict] = []
+        self.by_id: Dict[str, Dict] = {}
+        self._views: Dict[Tuple[str, str, Optional[bool]], Tuple[List[Tuple[int, str]], List[Dict]]] = {}
+        self.search_index = SearchIndex()
+        self._library_stats: Optional[Dict] = None
+        self._overlap: Optional[Dict] = None
+
+    def refresh(self) -> bool:
+        """Recarga el índice si el almacén cambió; devuelve True si se recargó"""
+        token = self.store.change_token()
+        if token == self._token:
+            return False
+        with self._lock:
+            if token == self._token:
+                return False
+            # La ruta de la miniatura es de esta API: no se guarda en results.json ni en los shards
+            entries = [{'name': name, **details, 'thumbnail': thumbnail_path(details.get('image'))}
+                       for name, details in self.store.iter_sorted()]
+            fingerprint = hashlib.sha1(json.dumps(entries, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+            by_id = {entry['id']: entry for entry in entries}
+            # Actualizar la búsqueda solo con las altas, renombres y bajas
+            for playlist_id, entry in by_id.items():
+                old = self.by_id.get(playlist_id)
+                if old is None or old['name'] != entry['name']:
+                    self.search_index.add(playlist_id, entry['name'])
+            for playlist_id in self.by_id.keys() - by_id.keys():
+                self.search_index.remove(playlist_id)
+            self.entries = entries
+            self.by_id = by_id
+            self._views = {}
+            self._library_stats = None
+            self._overlap = None
+            self._token = token
+            self.fingerprint = fingerprint.hexdigest()
+            logger.info(f"📇 Índice de resultados cargado: {len(entries)} playlists")
+            return True
+
+    def _view(self, sort: str, order: str, listened: Optional[bool]) -> Tuple[List[Tuple[int, str]], List[Dict]]:
+        view_key = (sort, order, listened)
+        view = self._views.get(view_key)
+        if view is None:
+            with self._lock:
+                key_fn = SORT_KEYS[sort]
+                sign = -1 if order == 'desc' else 1
+                entries = [e for e in self.entries if listened is None or bool(e.get('listened')) == listened]
+                entries.sort(key=lambda e: (sign * key_fn(e), e['id']))
+                view = ([(sign * key_fn(e), e['id']) for e in entries], entries)
+                self._views[view_key] = view
+        return view
+
+    def page(self, sort: str = 'duration', order: str = 'desc', listened: Optional[bool] = None,
+             limit: int = 50, cursor: Optional[str] = None) -> Dict:
+        """
+        Devuelve una página de playlists ordenada y filtrada.
+        El cursor apunta a la última playlist de la página anterior.
+        """
+        if sort not in SORT_KEYS:
+            raise InvalidQueryError(f"Orden desconocido: {sort} (opciones: {', '.join(SORT_KEYS)})")
+        if order not in ('asc', 'desc'):
+            raise InvalidQueryError(f"Dirección desconocida: {order} (opciones: asc, desc)")
+        keys, entries = self._view(sort, order, listened)
+        start = 0
+        if cursor:
+            key, playlist_id = decode_cursor(cursor)
+            start = bisect.bisect_right(keys, (key, playlist_id))
+        items = entries[start:start + limit]
+        next_cursor = None
+        if start + limit < len(entries) and items:
+            last_key, last_id = keys[start + len(items) - 1]
+            next_cursor = encode_cursor(last_key, last_id)
+        return {"items": items, "next_cursor": next_cursor, "total": len(entries)}
+
+    def search(self, query: str, limit: int = 20) -> Dict:
+        """Busca playlists por nombre y devuelve las entradas ordenadas por relevancia"""
+        by_id = self.by_id
+        items = [{**by_id[playlist_id], 'score': score}
+                 for playlist_id, score in self.search_index.search(query, limit)
+                 if playlist_id in by_id]
+        return {"items": items, "total": len(items)}
+
+    def library_stats(self) -> Dict:
+        """Estadísticas de todos los tracks de las playlists completas; se calculan una vez por recarga"""
+        stats = self._library_stats
+        if stats is None:
+            columns = TrackColumns.concat(columns for _, columns in self.store.iter_track_columns())
+            overlap = self._library_overlap()
+            available = overlap['available']
+            stats = self._library_stats = {
+                "playlists": len(self.entries),
+                **track_stats(columns),
+                # Sin ids no se sabe qué tracks se repiten
+                "unique_tracks": overlap['unique_tracks'] if available else None,
+                "unique_duration_ms": overlap['unique_duration_ms'] if available else None
+            }
+        return stats
+
+    def _library_overlap(self) -> Dict:
+        overlap = self._overlap
+        if overlap is None:
+            overlap = self._overlap = library_overlap(self.store.iter_track_columns(), OVERLAP_MIN_JACCARD)
+        return overlap
+
+    def overlap(self, min_jaccard: float = 0.0, limit: int = 100) -> Dict:
+        """
+        Resumen de duplicados de la biblioteca y los pares de playlists que más
+        se solapan (solo se guardan los pares con Jaccard >= OVERLAP_MIN_JACCARD)
+        """
+        overlap = self._library_overlap()
+        if not overlap['available']:
+            raise OverlapUnavailableError("Duplicados no disponibles: los tracks se escanearon sin la agregación "
+                                          "overlap (ZORTIFY_AGGREGATIONS)")
+        by_id = self.by_id
+        pairs = [
+            {**pair, "a_name": by_id[pair['a']]['name'], "b_name": by_id[pair['b']]['name']}
+            for pair in overlap['overlaps']
+            if pair['jaccard'] >= min_jaccard and pair['a'] in by_id and pair['b'] in by_id
+        ]
+        return {
+            "tracks": overlap['tracks'],
+            "tracks_without_id": overlap['tracks_without_id'],
+            "unique_tracks": overlap['unique_tracks'],
+            "total_duration_ms": overlap['total_duration_ms'],
+            "unique_duration_ms": overlap['unique_duration_ms'],
+            "pairs": pairs[:limit],
+            "total_pairs": len(pairs)
+        }
+
+    def playlist_overlap(self, playlist_id: str) -> Optional[Dict]:
+        """Tracks distintos y solo en esta playlist, y las playlists con las que más comparte"""
+        overlap = self._library_overlap()
+        counts = overlap['playlists'].get(playlist_id)
+        if counts is None:
+            return None
+        shared_with = []
+        for pair in overlap['overlaps']:
+            if playlist_id not in (pair['a'], pair['b']):
+                continue
+            other = pair['b'] if pair['a'] == playlist_id else pair['a']
+            if other in self.by_id:
+                shared_with.append({"id": other, "name": self.by_id[other]['name'],
+                                    "shared_tracks": pair['shared_tracks'], "jaccard": pair['jaccard']})
+            if len(shared_with) == 10:
+                break
+        return {**counts, "shared_with": shared_with}
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import time
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+WHITESPACE = ' \t\r\n'
+NUMBER_CHARS = '0123456789+-.eE'
+MANIFEST_NAME = 'manifest.json'
+SHARD_PREFIX = 'shard-'
+
+def duration_seconds(duration: Dict[str, int]) -> int:
+    """Convierte el diccionario de duración de results.json a segundos"""
+    return (duration['days'] * 86400 + duration['hours'] * 3600
+            + duration['minutes'] * 60 + duration['seconds'])
+
+def iter_results(path: str, chunk_size: int = 1 << 16) -> Iterator[Tuple[str, Dict]]:
+    """
+    Lee un results.json entrada por entrada sin cargarlo entero: la memoria
+    queda acotada por el bloque de lectura y la entrada más grande.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buf, pos = '', 0
+
+        def more() -> bool:
+            nonlocal buf, pos
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return False
+            buf, pos = buf[pos:] + chunk, 0
+            return True
+
+        def peek() -> str:
+            """Salta los espacios y devuelve el siguiente carácter ('' al final del archivo)"""
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in WHITESPACE:
+                    pos += 1
+                if pos < len(buf):
+                    return buf[pos]
+                if not more():
+                    return ''
+
+        def expect(chars: str) -> str:
+            nonlocal pos
+            char = peek()
+            if not char or char not in chars:
+                raise ValueError(f"{path}: se esperaba uno de {chars!r} y se encontró {char!r}")
+            pos += 1
+            return char
+
+        def decode():
+            nonlocal pos
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    # El valor puede estar cortado al final del bloque: leer más y reintentar
+                    if not more():
+                        raise
+                    continue
+                # Un número cortado al final del bloque ("12" de "1234", "-2." de "-2.5")
+                # se decodifica igual: si detrás solo quedan caracteres de número, leer más
+                if (isinstance(value, (int, float)) and not buf[end:].strip(NUMBER_CHARS)
+                        and more()):
+                    continue
+                pos = end
+                return value
+
+        expect('{')
+        if peek() == '}':
+            return
+        while True:
+            peek()
+            name = decode()
+            expect(':')
+            peek()
+            yield name, decode()
+            if expect(',}') == '}':
+                return
+
+def write_results(path: str, entries: Iterable[Tuple[str, Dict]]):
+    """
+    Escribe un results.json entrada por entrada y de forma atómica: primero un
+    archivo temporal en el mismo directorio y después un rename, así quien lo
+    lea ve el archivo anterior o el nuevo, nunca uno a medias.
+    """
+    tmp_path = f'{path}.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('{')
+            first = True
+            for name, details in entries:
+                body = json.dumps(details, ensure_ascii=False, indent=4).replace('\n', '\n    ')
+                f.write(f'{"" if first else ","}\n    {json.dumps(name, ensure_ascii=False)}: {body}')
+                first = False
+            f.write('\n}' if not first else '}')
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+def _write_atomic(path: str, data: bytes):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _manifest_shards(manifest_path: str) -> List[str]:
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return [shard['file'] for shard in json.load(f)['shards']]
+    except (OSError, ValueError, KeyError):
+        return []
+
+def write_shards(out_dir: str, entries: Iterable[Tuple[str, Dict]], shard_size: int = 100) -> Dict:
+    """
+    Exporta las entradas (ya ordenadas por duración) para un frontend
+    estático: shards de shard_size playlists, cada uno un array JSON de
+    {"name", ...entrada} con el hash de su contenido en el nombre, y un
+    manifest.json chico que los lista en orden. Un shard cuyo contenido no
+    cambió conserva su nombre, así el navegador lo sigue teniendo en caché
+    entre escaneos: los shards se pueden servir como inmutables y solo el
+    manifest sin caché. Se escribe el manifest al final y de forma atómica;
+    los shards que ya no usa ni el manifest nuevo ni el anterior se borran
+    (quien tenga abierto el anterior puede terminar de cargarlo).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    previous = set(_manifest_shards(manifest_path))
+    shards = []
+    chunk: List[Dict] = []
+    total = 0
+
+    def flush_chunk():
+        data = json.dumps(chunk, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        name = f'{SHARD_PREFIX}{hashlib.sha256(data).hexdigest()[:16]}.json'
+        path = os.path.join(out_dir, name)
+        # Mismo nombre, mismo contenido: no hace falta reescribirlo
+        if not os.path.exists(path):
+            _write_atomic(path, data)
+        shards.append({
+            "file": name,
+            "first_rank": total - len(chunk),
+            "count": len(chunk),
+            "bytes": len(data),
+            "max_duration_s": duration_seconds(chunk[0]['duration']),
+            "min_duration_s": duration_seconds(chunk[-1]['duration'])
+        })
+        chunk.clear()
+
+    for name, details in entries:
+        chunk.append({"name": name, **details})
+        total += 1
+        if len(chunk) == shard_size:
+            flush_chunk()
+    if chunk:
+        flush_chunk()
+
+    manifest = {
+        "version": 1,
+        "generated_at": int(time.time()),
+        "total": total,
+        "shard_size": shard_size,
+        "shards": shards
+    }
+    _write_atomic(manifest_path, json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
+
+    keep = previous | {shard['file'] for shard in shards}
+    for name in os.listdir(out_dir):
+        if name.startswith(SHARD_PREFIX) and name.endswith('.json') and name not in keep:
+            os.remove(os.path.join(out_dir, name))
+    return manifest
@@ -0,0 +1,326 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import metrics
+from migrations import migrate_entry, upgrade_store
+from results_json import duration_seconds, iter_results, write_results, write_shards
+from track_store import TrackColumns
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS playlists (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    duration_s INTEGER NOT NULL,
+    snapshot_id TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_playlists_duration ON playlists(duration_s DESC);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    playlist_id TEXT NOT NULL,
+    snapshot_id TEXT,
+    page_offset INTEGER NOT NULL,
+    duration_ms INTEGER NOT NULL,
+    tracks_processed INTEGER NOT NULL,
+    invalid_tracks INTEGER NOT NULL,
+    page_size INTEGER NOT NULL,
+    PRIMARY KEY (playlist_id, page_offset)
+);
+CREATE TABLE IF NOT EXISTS track_pages (
+    playlist_id TEXT NOT NULL,
+    snapshot_id TEXT,
+    page_offset INTEGER NOT NULL,
+    duration_ms BLOB NOT NULL,
+    album_type BLOB NOT NULL,
+    track_id BLOB NOT NULL DEFAULT X'',
+    PRIMARY KEY (playlist_id, page_offset)
+);
+CREATE TABLE IF NOT EXISTS tracks (
+    track_id INTEGER PRIMARY KEY,
+    spotify_id TEXT NOT NULL UNIQUE
+);
+"""
+
+commit_seconds = metrics.Histogram('zortify_store_commit_seconds',
+                                   'Duración de cada transacción del escritor de resultados')
+commit_ops = metrics.Counter('zortify_store_writes_total', 'Escrituras confirmadas en el almacén', ('kind',))
+export_seconds = metrics.Histogram('zortify_store_export_seconds', 'Duración de la exportación de results.json')
+
+def store_paths(account_name: Optional[str] = None) -> Tuple[str, str]:
+    """Archivos (base, results.json) de una cuenta de accounts.json; sin cuenta, los de siempre"""
+    if account_name is None:
+        return 'results.db', 'results.json'
+    return f'results-{account_name}.db', f'results-{account_name}.json'
+
+class ResultsStore:
+    """
+    Almacén de resultados en SQLite con un único hilo escritor.
+    Las escrituras se encolan y se confirman en grupo; el índice por duración
+    se mantiene al insertar, así que results.json solo se genera al exportar.
+    Los tracks de cada página se guardan por columnas (track_pages) para las
+    estadísticas de la biblioteca.
+    """
+    def __init__(self, path: str = 'results.db', json_path: str = 'results.json',
+                 commit_interval: float = 0.5, batch_size: int = 100):
+        self.path = path
+        self.json_path = json_path
+        self.commit_interval = commit_interval
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._local = threading.local()
+
+        new = not os.path.exists(path)
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        empty = conn.execute("SELECT COUNT(*) FROM playlists").fetchone()[0] == 0
+        if empty and os.path.exists(json_path):
+            self._import_json(conn)
+        # Las entradas importadas ya se migraron una por una
+        upgrade_store(conn, new=new)
+
+        # Conexión propia para detectar cambios confirmados por otras conexiones
+        self._watch_conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._watch_lock = threading.Lock()
+
+        self._writer = threading.Thread(target=self._write_loop, name='results-writer', daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        # Una conexión de lectura por hilo; WAL permite leer mientras el escritor confirma
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _import_json(self, conn: sqlite3.Connection):
+        """Carga un results.json existente en una base vacía, en streaming y migrando cada entrada"""
+        imported = 0
+
+        def rows():
+            nonlocal imported
+            for name, d in iter_results(self.json_path):
+                migrate_entry(d)
+                imported += 1
+                yield d['id'], name, duration_seconds(d['duration']), d.get('snapshot_id'), json.dumps(d, ensure_ascii=False)
+
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO playlists (id, name, duration_s, snapshot_id, data) VALUES (?, ?, ?, ?, ?)",
+                    rows()
+                )
+            logger.info(f"📥 Importadas {imported} playlists de {self.json_path} a {self.path}")
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"❌ Error importando {self.json_path}: {str(e)}")
+
+    # Escritura
+
+    def put(self, name: str, details: Dict):
+        """Encola la entrada de una playlist (reemplaza la anterior con el mismo id)"""
+        self._queue.put(('put', name, details))
+
+    def delete(self, playlist_ids: List[str]):
+        """Encola el borrado de playlists por id"""
+        for playlist_id in playlist_ids:
+            self._queue.put(('delete', playlist_id, None))
+
+    def checkpoint(self, playlist_id: str, snapshot_id: Optional[str], offset: int, page_size: int,
+                   page_totals: Dict, columns: Optional[TrackColumns] = None):
+        """
+        Encola el registro de una página completada (page_size tracks desde
+        offset), de lo que aportó a los totales y de sus tracks
+        """
+        self._queue.put(('checkpoint', playlist_id, (snapshot_id, offset, page_size, page_totals, columns)))
+
+    def flush(self):
+        """Bloquea hasta que todas las escrituras encoladas estén confirmadas"""
+        self._queue.join()
+
+    def pending(self) -> int:
+        """Escrituras encoladas que el escritor aún no confirmó"""
+        return self._queue.qsize()
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            ops = [self._queue.get()]
+            deadline = time.monotonic() + self.commit_interval
+            # Agrupar lo que llegue durante la ventana en una sola transacción
+            while len(ops) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    ops.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # Cualquier error (también los que no son de SQLite, como una entrada
+            # mal formada) se loguea y el escritor sigue: si el hilo muriera,
+            # las escrituras siguientes se perderían y flush() no volvería nunca
+            try:
+                with commit_seconds.time(), conn:
+                    for op in ops:
+                        self._apply(conn, op)
+                        commit_ops.inc(kind=op[0])
+            except Exception as e:
+                logger.error(f"❌ Error guardando resultados en {self.path}: {str(e)}")
+                if len(ops) > 1:
+                    self._apply_each(conn, ops)
+            finally:
+                for _ in ops:
+                    self._queue.task_done()
+
+    def _apply_each(self, conn: sqlite3.Connection, ops: List[Tuple]):
+        """Reintenta un lote que falló de a una escritura por transacción, para perder solo las que fallan"""
+        for op in ops:
+            try:
+                with conn:
+                    self._apply(conn, op)
+                commit_ops.inc(kind=op[0])
+            except Exception as e:
+                logger.error(f"❌ Escritura descartada ({op[0]} {op[1]}): {str(e)}")
+
+    def _apply(self, conn: sqlite3.Connection, op: Tuple):
+        kind, key, details = op
+        if kind == 'delete':
+            conn.execute("DELETE FROM playlists WHERE id = ?", (key,))
+            conn.execute("DELETE FROM checkpoints WHERE playlist_id = ?", (key,))
+            conn.execute("DELETE FROM track_pages WHERE playlist_id = ?", (key,))
+            return
+        if kind == 'checkpoint':
+            snapshot_id, offset, page_size, page, columns = details
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoints "
+                "(playlist_id, snapshot_id, page_offset, duration_ms, tracks_processed, invalid_tracks, page_size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, snapshot_id, offset, page['duration_ms'], page['tracks_processed'], page['invalid_tracks'],
+                 page_size)
+            )
+            if columns is not None:
+                track_ids = self._dense_track_ids(conn, columns.spotify_ids)
+                conn.execute(
+                    "INSERT OR REPLACE INTO track_pages "
+                    "(playlist_id, snapshot_id, page_offset, duration_ms, album_type, track_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, snapshot_id, offset, *columns.to_blobs(), track_ids.tobytes())
+                )
+            return
+        # Conservar la marca de escuchada de la entrada anterior (las nuevas empiezan sin escuchar)
+        row = conn.execute("SELECT data FROM playlists WHERE id = ?", (details['id'],)).fetchone()
+        listened = json.loads(row[0]).get('listened', False) if row else False
+        details = {**details, 'listened': details.get('listened', listened)}
+        conn.execute(
+            "INSERT OR REPLACE INTO playlists (id, name, duration_s, snapshot_id, data) VALUES (?, ?, ?, ?, ?)",
+            (details['id'], key, duration_seconds(details['duration']), details.get('snapshot_id'),
+             json.dumps(details, ensure_ascii=False))
+        )
+        # La playlist está completa: su checkpoint ya no hace falta, ni los tracks de snapshots anteriores
+        if details.get('processing_complete'):
+            conn.execute("DELETE FROM checkpoints WHERE playlist_id = ?", (details['id'],))
+            conn.execute("DELETE FROM track_pages WHERE playlist_id = ? AND snapshot_id IS NOT ?",
+                         (details['id'], details.get('snapshot_id')))
+
+    def _dense_track_ids(self, conn: sqlite3.Connection, spotify_ids: List[Optional[str]]) -> array:
+        """Traduce ids de Spotify a enteros densos, asignando uno nuevo a cada track no visto (0 si no hay id)"""
+        wanted = list({spotify_id for spotify_id in spotify_ids if spotify_id})
+        known = {}
+        # De a 500 para no pasar el límite de parámetros de SQLite
+        for i in range(0, len(wanted), 500):
+            chunk = wanted[i:i + 500]
+            known.update(conn.execute(
+                f"SELECT spotify_id, track_id FROM tracks WHERE spotify_id IN ({','.join('?' * len(chunk))})", chunk
+            ))
+        for spotify_id in wanted:
+            if spotify_id not in known:
+                known[spotify_id] = conn.execute("INSERT INTO tracks (spotify_id) VALUES (?)", (spotify_id,)).lastrowid
+        return array('I', (known[spotify_id] if spotify_id else 0 for spotify_id in spotify_ids))
+
+    # Lectura
+
+    def iter_sorted(self) -> Iterator[Tuple[str, Dict]]:
+        """Recorre las playlists de mayor a menor duración usando el índice"""
+        rows = self._reader().execute("SELECT name, data FROM playlists ORDER BY duration_s DESC, rowid")
+        for name, data in rows:
+            yield name, json.loads(data)
+
+    def load(self) -> Dict:
+        """Devuelve todas las entradas, ordenadas por duración, con el formato de results.json"""
+        return dict(self.iter_sorted())
+
+    def change_token(self) -> int:
+        """Valor que cambia cada vez que el escritor (u otro proceso) confirma cambios"""
+        with self._watch_lock:
+            return self._watch_conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def snapshots(self) -> Dict[str, Optional[str]]:
+        """Devuelve id de playlist -> snapshot_id con el que se procesó"""
+        return dict(self._reader().execute("SELECT id, snapshot_id FROM playlists"))
+
+    def load_checkpoint(self, playlist_id: str, snapshot_id: Optional[str]) -> Tuple[Dict[int, int], Dict]:
+        """
+        Devuelve las páginas ya completadas de una playlist (offset -> tamaño)
+        y los totales acumulados en ellas. Un checkpoint de otro snapshot no
+        sirve y se ignora.
+        """
+        rows = self._reader().execute(
+            "SELECT page_offset, page_size, duration_ms, tracks_processed, invalid_tracks FROM checkpoints "
+            "WHERE playlist_id = ? AND snapshot_id IS ?", (playlist_id, snapshot_id)
+        ).fetchall()
+        totals = {'duration_ms': 0, 'tracks_processed': 0, 'invalid_tracks': 0}
+        for _, _, duration_ms, tracks_processed, invalid_tracks in rows:
+            totals['duration_ms'] += duration_ms
+            totals['tracks_processed'] += tracks_processed
+            totals['invalid_tracks'] += invalid_tracks
+        return {row[0]: row[1] for row in rows}, totals
+
+    def export_json(self, path: Optional[str] = None):
+        """
+        Escribe results.json para el frontend, entrada por entrada y de forma
+        atómica (archivo temporal + rename)
+        """
+        with export_seconds.time():
+            write_results(path or self.json_path, self.iter_sorted())
+
+    def export_shards(self, out_dir: str, shard_size: int = 100) -> Dict:
+        """Exporta las playlists en shards por duración para servir el frontend estático (ver write_shards)"""
+        with export_seconds.time():
+            return write_shards(out_dir, self.iter_sorted(), shard_size)
+
+    def load_track_pages(self, playlist_id: str, snapshot_id: Optional[str]) -> Dict[int, TrackColumns]:
+        """Devuelve offset -> columnas de tracks de las páginas guardadas de un snapshot"""
+        rows = self._reader().execute(
+            "SELECT page_offset, duration_ms, album_type, track_id FROM track_pages "
+            "WHERE playlist_id = ? AND snapshot_id IS ?", (playlist_id, snapshot_id)
+        )
+        return {offset: TrackColumns.from_blobs(*blobs) for offset, *blobs in rows}
+
+    def iter_track_columns(self) -> Iterator[Tuple[str, TrackColumns]]:
+        """Recorre las columnas de tracks de cada playlist completa (del snapshot con el que se procesó)"""
+        rows = self._reader().execute(
+            "SELECT t.playlist_id, t.duration_ms, t.album_type, t.track_id FROM track_pages t "
+            "JOIN playlists p ON p.id = t.playlist_id AND p.snapshot_id IS t.snapshot_id "
+            "ORDER BY t.playlist_id, t.page_offset"
+        )
+        current_id, columns = None, None
+        for playlist_id, *blobs in rows:
+            if playlist_id != current_id:
+                if columns is not None:
+                    yield current_id, columns
+                current_id, columns = playlist_id, TrackColumns()
+            columns.extend(TrackColumns.from_blobs(*blobs))
+        if columns is not None:
+            yield current_id, columns
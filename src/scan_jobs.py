@@ -0,0 +1,118 @@
+import itertools
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class JobConflictError(Exception):
+    """Ya hay un escaneo en curso"""
+
+class ScanJob:
+    """
+    Un escaneo en segundo plano. Los eventos (playlist terminada, progreso,
+    fin) se guardan en orden para que cada cliente SSE pueda retomar desde
+    el último que recibió.
+    """
+    def __init__(self):
+        self.id = uuid.uuid4().hex[:12]
+        self.state = 'pending'
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.last_progress: Dict = {}
+        self._events: List[Tuple[int, str, Dict]] = []
+        self._cond = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ('done', 'failed')
+
+    def publish(self, kind: str, data: Dict):
+        with self._cond:
+            self._events.append((len(self._events), kind, data))
+            if kind == 'progress':
+                self.last_progress = data
+            self._cond.notify_all()
+
+    def finish(self, state: str, error: Optional[str] = None):
+        with self._cond:
+            self.state = state
+            self.error = error
+            self.finished_at = time.time()
+            self._events.append((len(self._events), state, self.status()))
+            self._cond.notify_all()
+
+    def events_since(self, index: int, timeout: float) -> List[Tuple[int, str, Dict]]:
+        """Espera hasta timeout a que haya eventos desde index (o a que el escaneo termine)"""
+        with self._cond:
+            self._cond.wait_for(lambda: len(self._events) > index or self.finished, timeout)
+            return self._events[index:]
+
+    def status(self) -> Dict:
+        return {
+            "id": self.id,
+            "state": self.state,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "progress": self.last_progress
+        }
+
+class JobManager:
+    """
+    Lanza escaneos en un hilo de fondo, de a uno por vez (el escaneo usa el
+    estado global del módulo). Mientras corre publica el progreso cada
+    progress_interval segundos.
+    """
+    def __init__(self, run_scan: Callable[[Callable[[str, Dict], None]], None],
+                 snapshot: Callable[[], Dict], progress_interval: float = 2.0, keep: int = 20):
+        self.run_scan = run_scan
+        self.snapshot = snapshot
+        self.progress_interval = progress_interval
+        self.keep = keep
+        self._jobs: 'OrderedDict[str, ScanJob]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self) -> ScanJob:
+        with self._lock:
+            running = [job for job in self._jobs.values() if not job.finished]
+            if running:
+                raise JobConflictError(f"Ya hay un escaneo en curso: {running[0].id}")
+            job = ScanJob()
+            self._jobs[job.id] = job
+            # Conservar solo los últimos escaneos
+            for old_id in list(itertools.islice(self._jobs, max(0, len(self._jobs) - self.keep))):
+                del self._jobs[old_id]
+        threading.Thread(target=self._run, args=(job,), name=f'scan-{job.id}', daemon=True).start()
+        return job
+
+    def get(self, job_id: str) -> Optional[ScanJob]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[ScanJob]:
+        return list(self._jobs.values())
+
+    def _run(self, job: ScanJob):
+        job.state = 'running'
+        stop = threading.Event()
+
+        def tick():
+            while not stop.wait(self.progress_interval):
+                job.publish('progress', self.snapshot())
+
+        ticker = threading.Thread(target=tick, name=f'scan-{job.id}-progress', daemon=True)
+        ticker.start()
+        try:
+            self.run_scan(job.publish)
+            stop.set()
+            job.publish('progress', self.snapshot())
+            job.finish('done')
+            logger.info(f"✅ Escaneo {job.id} terminado")
+        except Exception as e:
+            stop.set()
+            logger.error(f"❌ Escaneo {job.id} falló: {str(e)}")
+            job.finish('failed', str(e))
@@ -0,0 +1,120 @@
+import bisect
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+from typing import Dict, List, Set, Tuple
+
+TOKEN_SPLIT = re.compile(r'[^\w]+')
+
+def normalize(text: str) -> str:
+    """Minúsculas y sin acentos ni signos: 'Canción Ñoña!' -> 'cancion nona'"""
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(t for t in TOKEN_SPLIT.split(stripped.casefold()) if t)
+
+def trigrams(normalized: str) -> Set[str]:
+    padded = f'  {normalized} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class SearchIndex:
+    """
+    Índice de búsqueda sobre los nombres de las playlists: prefijos de
+    palabras (lista ordenada + bisect) y trigramas para coincidencias
+    aproximadas. Se actualiza playlist a playlist, sin reconstruirse.
+    """
+    def __init__(self, min_similarity: float = 0.5):
+        self.min_similarity = min_similarity
+        self._lock = threading.Lock()
+        self._docs: Dict[str, Tuple[str, Set[str]]] = {}  # id -> (nombre normalizado, trigramas)
+        self._tokens: List[Tuple[str, str]] = []  # (palabra, id) ordenado
+        self._postings: Dict[str, Set[str]] = defaultdict(set)  # trigrama -> ids
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, playlist_id: str, name: str):
+        """Agrega o actualiza el nombre de una playlist"""
+        normalized = normalize(name)
+        with self._lock:
+            if playlist_id in self._docs:
+                if self._docs[playlist_id][0] == normalized:
+                    return
+                self._remove(playlist_id)
+            grams = trigrams(normalized) if normalized else set()
+            self._docs[playlist_id] = (normalized, grams)
+            for token in set(normalized.split()):
+                bisect.insort(self._tokens, (token, playlist_id))
+            for gram in grams:
+                self._postings[gram].add(playlist_id)
+
+    def remove(self, playlist_id: str):
+        with self._lock:
+            if playlist_id in self._docs:
+                self._remove(playlist_id)
+
+    def _remove(self, playlist_id: str):
+        normalized, grams = self._docs.pop(playlist_id)
+        for token in set(normalized.split()):
+            i = bisect.bisect_left(self._tokens, (token, playlist_id))
+            if i < len(self._tokens) and self._tokens[i] == (token, playlist_id):
+                del self._tokens[i]
+        for gram in grams:
+            postings = self._postings[gram]
+            postings.discard(playlist_id)
+            if not postings:
+                del self._postings[gram]
+
+    def _prefix_ids(self, prefix: str) -> Set[str]:
+        ids = set()
+        i = bisect.bisect_left(self._tokens, (prefix, ''))
+        while i < len(self._tokens) and self._tokens[i][0].startswith(prefix):
+            ids.add(self._tokens[i][1])
+            i += 1
+        return ids
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[str, float]]:
+        """
+        Devuelve (id, puntaje) de las mejores coincidencias. Pesan más el nombre
+        exacto, luego el nombre que empieza por la consulta, luego que todas las
+        palabras coincidan por prefijo; la similitud de trigramas desempata y
+        permite encontrar nombres con errores de tipeo (min_similarity es la
+        fracción de trigramas de la consulta que debe aparecer en el nombre).
+        """
+        normalized = normalize(query)
+        if not normalized:
+            return []
+        query_grams = trigrams(normalized)
+        with self._lock:
+            # Todas las palabras de la consulta deben ser prefijo de alguna palabra del nombre
+            prefix_ids = None
+            for token in normalized.split():
+                ids = self._prefix_ids(token)
+                prefix_ids = ids if prefix_ids is None else prefix_ids & ids
+            prefix_ids = prefix_ids or set()
+
+            shared = defaultdict(int)
+            for gram in query_grams:
+                for playlist_id in self._postings.get(gram, ()):
+                    shared[playlist_id] += 1
+
+            scored = []
+            for playlist_id in prefix_ids | shared.keys():
+                name, grams = self._docs[playlist_id]
+                common = shared.get(playlist_id, 0)
+                # Cuánto de la consulta aparece en el nombre, y cuánto se parecen en conjunto
+                coverage = common / len(query_grams)
+                if playlist_id not in prefix_ids and coverage < self.min_similarity:
+                    continue
+                jaccard = common / (len(query_grams) + len(grams) - common) if grams else 0.0
+                score = 0.7 * coverage + 0.3 * jaccard
+                if name == normalized:
+                    score += 3
+                elif name.startswith(normalized):
+                    score += 2
+                elif playlist_id in prefix_ids:
+                    score += 1
+                scored.append((playlist_id, round(score, 4)))
+
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return scored[:limit]
@@ -0,0 +1,188 @@
+import base64
+import bisect
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+ALBUM_TYPES = ('album', 'single', 'compilation', 'other')
+ALBUM_TYPE_CODES = {name: code for code, name in enumerate(ALBUM_TYPES)}
+
+# Límites (en segundos) del histograma de duraciones: <1 min, 1-2, ..., 8-10, >=10 min
+HISTOGRAM_EDGES_S = (60, 120, 180, 240, 300, 360, 480, 600)
+
+PERCENTILES = (10, 25, 75, 90)
+
+class TrackColumns:
+    """
+    Tracks válidos de una playlist (o de una página) guardados por columnas
+    en arrays compactos: 4 bytes de duración y 1 de tipo de álbum por
+    track, en lugar de un diccionario por track.
+    Los ids de Spotify llegan en spotify_ids y el almacén los guarda como
+    enteros densos (track_id, 4 bytes; 0 si el track no tiene id).
+    """
+    __slots__ = ('duration_ms', 'album_type', 'track_id', 'spotify_ids')
+
+    def __init__(self):
+        self.duration_ms = array('I')
+        self.album_type = array('B')
+        self.track_id = array('I')
+        self.spotify_ids: List[Optional[str]] = []
+
+    def __len__(self) -> int:
+        return len(self.duration_ms)
+
+    def append(self, track: Dict):
+        self.spotify_ids.append(track.get('id'))
+        self.duration_ms.append(track['duration_ms'])
+        album_type = (track.get('album') or {}).get('album_type')
+        self.album_type.append(ALBUM_TYPE_CODES.get(album_type, ALBUM_TYPE_CODES['other']))
+
+    def extend(self, other: 'TrackColumns'):
+        self.duration_ms.extend(other.duration_ms)
+        self.album_type.extend(other.album_type)
+        self.track_id.extend(other.track_id)
+        self.spotify_ids.extend(other.spotify_ids)
+
+    def to_blobs(self) -> Tuple[bytes, bytes]:
+        return self.duration_ms.tobytes(), self.album_type.tobytes()
+
+    @classmethod
+    def from_blobs(cls, duration_ms: bytes, album_type: bytes, track_id: bytes = b'') -> 'TrackColumns':
+        columns = cls()
+        columns.duration_ms.frombytes(duration_ms)
+        columns.album_type.frombytes(album_type)
+        columns.track_id.frombytes(track_id)
+        return columns
+
+    def to_payload(self) -> Dict:
+        """Columnas serializables a JSON (base64, orden de bytes nativo), con los ids de Spotify"""
+        duration_ms, album_type = (base64.b64encode(blob).decode('ascii') for blob in self.to_blobs())
+        return {"duration_ms": duration_ms, "album_type": album_type, "spotify_ids": self.spotify_ids}
+
+    @classmethod
+    def from_payload(cls, payload: Dict) -> 'TrackColumns':
+        columns = cls.from_blobs(*(base64.b64decode(payload[key]) for key in ('duration_ms', 'album_type')))
+        columns.spotify_ids = list(payload['spotify_ids'])
+        return columns
+
+    @classmethod
+    def concat(cls, parts: Iterable['TrackColumns']) -> 'TrackColumns':
+        columns = cls()
+        for part in parts:
+            columns.extend(part)
+        return columns
+
+def _percentile(ordered: array, pct: float) -> int:
+    # Rango más cercano sobre las duraciones ya ordenadas
+    return ordered[min(len(ordered) - 1, max(0, round(len(ordered) * pct / 100) - 1))]
+
+def track_stats(columns: TrackColumns) -> Dict:
+    """
+    Estadísticas de duración y tipo de álbum de un conjunto de tracks.
+    Todo se calcula sobre las columnas completas (un sort, bisects sobre el
+    array ordenado y conteos de bytes), sin recorrer los tracks en Python.
+    """
+    count = len(columns)
+    if not count:
+        return {"tracks": 0}
+    ordered = array('I', sorted(columns.duration_ms))
+    album_bytes = columns.album_type.tobytes()
+    edges = [bisect.bisect_left(ordered, edge * 1000) for edge in HISTOGRAM_EDGES_S]
+    bounds = [0] + edges + [count]
+    return {
+        "tracks": count,
+        "duration_ms": {
+            "min": ordered[0],
+            "median": _percentile(ordered, 50),
+            "mean": round(sum(ordered) / count),
+            "max": ordered[-1],
+            **{f"p{pct}": _percentile(ordered, pct) for pct in PERCENTILES}
+        },
+        "album_types": {name: album_bytes.count(bytes([code])) for code, name in enumerate(ALBUM_TYPES)},
+        "duration_histogram": {
+            "edges_s": list(HISTOGRAM_EDGES_S),
+            "counts": [bounds[i + 1] - bounds[i] for i in range(len(bounds) - 1)]
+        }
+    }
+
+def _bitset(track_ids: array) -> int:
+    """Conjunto de ids densos como entero de Python: el bit i indica el track i"""
+    bitmap = bytearray(max(track_ids, default=0) // 8 + 1)
+    for track_id in track_ids:
+        bitmap[track_id >> 3] |= 1 << (track_id & 7)
+    bitmap[0] &= 0xFE  # El id 0 (track sin id) no se comparte con nadie
+    return int.from_bytes(bitmap, 'little')
+
+def library_overlap(playlists: Iterable[Tuple[str, TrackColumns]], min_jaccard: float = 0.05) -> Dict:
+    """
+    Duplicados entre playlists a partir de los ids densos de los tracks.
+    Cada playlist se reduce a un bitset (un entero de Python, un bit por track
+    de la biblioteca), así intersecciones y conteos son operaciones de enteros
+    en C. Devuelve la duración total y la única (cada track contado una vez),
+    los tracks que solo están en cada playlist y los pares de playlists con
+    Jaccard >= min_jaccard, de mayor a menor.
+    Los tracks sin id (0: archivos locales, o escaneos sin la agregación
+    overlap, que no piden el id) no entran en ninguna cuenta de duplicados:
+    se informan en tracks_without_id, y si hay tracks pero ninguno tiene id
+    available es False.
+    La memoria es de un bit por track de la biblioteca y por playlist.
+    """
+    bitsets: Dict[str, int] = {}
+    sizes: Dict[str, int] = {}
+    seen = bytearray()  # Un byte por id denso ya contado en la duración única
+    total_ms = unique_ms = tracks = without_id = 0
+    for playlist_id, columns in playlists:
+        ids = columns.track_id
+        if len(ids) != len(columns.duration_ms):
+            continue  # Páginas guardadas antes de que se registraran los ids
+        tracks += len(ids)
+        total_ms += sum(columns.duration_ms)
+        missing = ids.count(0)
+        without_id += missing
+        if missing == len(ids):
+            continue
+        highest = max(ids)
+        if len(seen) <= highest:
+            seen.extend(bytes(highest + 1 - len(seen)))
+        for track_id, duration_ms in zip(ids, columns.duration_ms):
+            if track_id and not seen[track_id]:
+                seen[track_id] = 1
+                unique_ms += duration_ms
+        bitset = _bitset(ids)
+        bitsets[playlist_id] = bitset
+        sizes[playlist_id] = bitset.bit_count()
+
+    # Tracks que aparecen en al menos dos playlists
+    any_playlist = shared = 0
+    for bitset in bitsets.values():
+        shared |= any_playlist & bitset
+        any_playlist |= bitset
+
+    overlaps = []
+    candidates = [pid for pid, bitset in bitsets.items() if bitset & shared]
+    for i, a in enumerate(candidates):
+        for b in candidates[i + 1:]:
+            # Cota: la intersección no puede superar a la playlist más chica
+            small, large = sorted((sizes[a], sizes[b]))
+            if not large or small / large < min_jaccard:
+                continue
+            common = (bitsets[a] & bitsets[b]).bit_count()
+            if not common:
+                continue
+            jaccard = common / (sizes[a] + sizes[b] - common)
+            if jaccard >= min_jaccard:
+                overlaps.append({"a": a, "b": b, "shared_tracks": common, "jaccard": round(jaccard, 4)})
+    overlaps.sort(key=lambda pair: (-pair['jaccard'], pair['a'], pair['b']))
+
+    return {
+        "available": not tracks or bool(bitsets),
+        "tracks": tracks,
+        "tracks_without_id": without_id,
+        "unique_tracks": any_playlist.bit_count(),
+        "total_duration_ms": total_ms,
+        "unique_duration_ms": unique_ms,
+        "playlists": {
+            pid: {"distinct_tracks": sizes[pid], "only_in_playlist": (bitset & ~shared).bit_count()}
+            for pid, bitset in bitsets.items()
+        },
+        "overlaps": overlaps
+    }
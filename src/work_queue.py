@@ -0,0 +1,180 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    task_key TEXT PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_claim ON tasks(state, priority);
+CREATE INDEX IF NOT EXISTS idx_tasks_run ON tasks(run_id, state);
+"""
+
+class Task(NamedTuple):
+    key: str
+    payload: Dict
+    attempts: int
+
+class LeaseQueue:
+    """
+    Cola de tareas durable en un archivo SQLite que comparten el coordinador
+    y los workers (procesos de la misma máquina u hosts que montan el mismo
+    archivo). Un worker reclama una tarea con un lease de lease_seconds y lo
+    renueva con heartbeat(); si muere, el lease vence y otro worker la
+    reclama. Tras max_attempts leases vencidos o fallos la tarea queda en
+    'failed'. Los resultados quedan en la cola hasta que el coordinador los
+    toma, así que ni el coordinador ni los workers pierden trabajo al caerse.
+    Usa el journal clásico de SQLite (no WAL) para funcionar sobre sistemas
+    de archivos de red; los leases usan el reloj de cada host.
+    """
+    def __init__(self, path: str = 'work_queue.db', lease_seconds: float = 60, max_attempts: int = 3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # Una conexión por hilo, en modo autocommit para controlar las transacciones a mano
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # IMMEDIATE toma el lock de escritura al empezar: dos workers no pueden reclamar la misma tarea
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    # Coordinador
+
+    def open_run(self, run_id: str):
+        """
+        Abre un escaneo. Hay un solo coordinador por cola: los escaneos que
+        quedaron abiertos (de un coordinador que se cayó) se cierran, pero sus
+        tareas se conservan para que enqueue() pueda adoptarlas.
+        """
+        with self._transaction() as conn:
+            conn.execute("UPDATE runs SET state = 'closed' WHERE state = 'open'")
+            conn.execute("INSERT OR REPLACE INTO runs VALUES (?, 'open', ?)", (run_id, time.time()))
+
+    def close_run(self, run_id: str):
+        """Marca el escaneo como terminado y borra sus tareas y las huérfanas (los workers sin trabajo pueden salir)"""
+        with self._transaction() as conn:
+            conn.execute("UPDATE runs SET state = 'closed' WHERE run_id = ?", (run_id,))
+            conn.execute("DELETE FROM tasks WHERE run_id IN (SELECT run_id FROM runs WHERE state = 'closed')")
+
+    def has_open_runs(self) -> bool:
+        return self._conn().execute("SELECT 1 FROM runs WHERE state = 'open' LIMIT 1").fetchone() is not None
+
+    def enqueue(self, run_id: str, tasks: List[Tuple[str, int, Dict]]):
+        """
+        Encola (clave, prioridad, payload); sale primero la prioridad más baja.
+        Una tarea con la misma clave de un escaneo anterior (por ejemplo, de un
+        coordinador que se cayó) pasa a este escaneo conservando su estado y su resultado.
+        """
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT INTO tasks (task_key, run_id, priority, payload) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(task_key) DO UPDATE SET run_id = excluded.run_id",
+                [(key, run_id, priority, json.dumps(payload)) for key, priority, payload in tasks]
+            )
+
+    def take_finished(self, run_id: str) -> List[Tuple[str, Dict, str, Optional[Dict], Optional[str]]]:
+        """Devuelve y borra las tareas terminadas del escaneo: (clave, payload, estado, resultado, error)"""
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT task_key, payload, state, result, error FROM tasks "
+                "WHERE run_id = ? AND state IN ('done', 'failed')", (run_id,)
+            ).fetchall()
+            conn.executemany("DELETE FROM tasks WHERE task_key = ?", [(row[0],) for row in rows])
+        return [(key, json.loads(payload), state, json.loads(result) if result else None, error)
+                for key, payload, state, result, error in rows]
+
+    def counts(self, run_id: str) -> Dict[str, int]:
+        return dict(self._conn().execute(
+            "SELECT state, COUNT(*) FROM tasks WHERE run_id = ? GROUP BY state", (run_id,)
+        ).fetchall())
+
+    # Workers
+
+    def claim(self, owner: str) -> Optional[Task]:
+        """Reclama la tarea pendiente (o con lease vencido) de menor prioridad"""
+        now = time.time()
+        with self._transaction() as conn:
+            # Las tareas que ya agotaron sus intentos no se vuelven a repartir
+            conn.execute(
+                "UPDATE tasks SET state = 'failed', error = 'lease vencido demasiadas veces' "
+                "WHERE state = 'leased' AND lease_until < ? AND attempts >= ?", (now, self.max_attempts)
+            )
+            row = conn.execute(
+                "SELECT task_key, payload, attempts FROM tasks "
+                "WHERE (state = 'pending' OR (state = 'leased' AND lease_until < ?)) "
+                "AND run_id IN (SELECT run_id FROM runs WHERE state = 'open') "
+                "ORDER BY priority, rowid LIMIT 1", (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            key, payload, attempts = row
+            conn.execute(
+                "UPDATE tasks SET state = 'leased', owner = ?, lease_until = ?, attempts = attempts + 1 "
+                "WHERE task_key = ?", (owner, now + self.lease_seconds, key)
+            )
+        if attempts:
+            logger.info(f"♻️ Tarea {key} reclamada de nuevo (intento {attempts + 1})")
+        return Task(key, json.loads(payload), attempts + 1)
+
+    def heartbeat(self, key: str, owner: str) -> bool:
+        """Renueva el lease; devuelve False si la tarea ya no es de este worker"""
+        with self._transaction() as conn:
+            updated = conn.execute(
+                "UPDATE tasks SET lease_until = ? WHERE task_key = ? AND owner = ? AND state = 'leased'",
+                (time.time() + self.lease_seconds, key, owner)
+            ).rowcount
+        return updated == 1
+
+    def complete(self, key: str, owner: str, result: Dict) -> bool:
+        """Guarda el resultado; se descarta si el lease se perdió y otro worker tomó la tarea"""
+        with self._transaction() as conn:
+            updated = conn.execute(
+                "UPDATE tasks SET state = 'done', result = ?, lease_until = NULL "
+                "WHERE task_key = ? AND owner = ? AND state = 'leased'",
+                (json.dumps(result), key, owner)
+            ).rowcount
+        return updated == 1
+
+    def fail(self, key: str, owner: str, error: str):
+        """Devuelve la tarea a la cola, o la marca como fallida si agotó sus intentos"""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE tasks SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "error = ?, lease_until = NULL WHERE task_key = ? AND owner = ? AND state = 'leased'",
+                (self.max_attempts, error, key, owner)
+            )
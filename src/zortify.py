@@ -1,112 +1,264 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify, redirect, request
 from flask_cors import CORS
 from spotipy.oauth2 import SpotifyOAuth
 import spotipy
+import requests
+from urllib3.util.retry import Retry
 import os
+import asyncio
 from concurrent.futures import ThreadPoolExecutor
-from dotenv import load_dotenv
 import json
+import gzip
+import hashlib
 import time
 from functools import lru_cache
-from typing import Dict, List, Optional, Tuple
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 import logging
 import signal
 import sys
 import threading
 import queue
+import re
+import socket
+import subprocess
+import uuid
 from datetime import datetime, timedelta
+from collections import deque
+from results_store import ResultsStore, store_paths
+from api_cache import ApiCache
+from results_index import InvalidQueryError, OverlapUnavailableError, ResultsIndex
+from scan_jobs import JobConflictError, JobManager
+from fair_queue import FairQueue
+from track_store import TrackColumns, track_stats
+from work_queue import LeaseQueue
+from log_pipeline import Sampler
+from image_cache import ImageCache, THUMBNAIL_SIZES
+from request_planner import MAX_PAGE_SIZE, PageCursor, PagePlanner, overlaps, track_fields, uncovered_ranges
+import metrics
 
-# Configuración de logging para mejor diagnóstico
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('zortify.log', encoding='utf-8')
-    ]
-)
+# Importar el módulo no tiene efectos: el log, el .env, las cuentas, las
+# sesiones y los manejadores de señales los prepara cli.py (o quien lo use
+# como biblioteca) al necesitarlos
 logger = logging.getLogger(__name__)
 
+# Los eventos que pueden repetirse por cada track o petición se loguean con
+# formato diferido (logger.info("...%s", valor), no f-strings) y muestreados
+throttle_log_sampler = Sampler(1.0)  # un aviso de 429 por cuenta y segundo
+skipped_track_sampler = Sampler(1.0)  # un track saltado por segundo (en DEBUG)
+page_log_sampler = Sampler(2.0)  # un aviso de avance por playlist cada 2 segundos
+
 app = Flask(__name__)
 CORS(app, resources={r"/api/*": {"origins": "http://localhost:3000"}})
 
-# Cargar las variables de entorno
-load_dotenv()
+if __name__ == '__main__':
+    # Con "python zortify.py" este módulo se ejecuta antes que cli.main: el
+    # .env tiene que estar cargado antes de armar CONFIG
+    from dotenv import load_dotenv
+    load_dotenv()
 
 # Constantes configurables
 def load_config():
     return {
-        "BATCH_SIZE": 50,
+        "BATCH_SIZE": MAX_PAGE_SIZE,  # Tracks por página al empezar; el planificador lo ajusta según la latencia
+        "ADAPTIVE_PAGE_SIZE": os.getenv('ZORTIFY_ADAPTIVE_PAGES', '1') == '1',
+        "PAGE_SIZE_MIN": 20,
+        "PAGE_LATENCY_BUDGET": 2.0,  # Latencia objetivo por página (segundos)
+        "THROTTLE_BUDGET": 0.05,  # Fracción de 429 tolerada: por encima el tamaño de página no se reduce
+        # Agregaciones además de los totales; cada una suma sus campos a la proyección de las páginas
+        "AGGREGATIONS": tuple(filter(None, os.getenv('ZORTIFY_AGGREGATIONS', 'track_stats,overlap').split(','))),
         "MAX_RETRIES": 3,
-        "MAX_WORKERS": 2,
+        "MAX_WORKERS": 4,
         "RETRY_DELAY": [1, 2, 4],
-        "REQUEST_DELAY": 0.5,
+        "REQUEST_DELAY": 0.5,  # Intervalo inicial entre peticiones (tasa de partida del limitador)
+        "RATE_BURST": 5,  # Peticiones que se pueden disparar de golpe
+        "RATE_MIN": 0.5,  # Tasa mínima (peticiones/segundo) tras varios 429
+        "RATE_MAX": 10.0,  # Tasa máxima a la que el limitador puede crecer
+        "RATE_INCREASE": 0.05,  # Incremento de tasa por cada petición exitosa
+        "GLOBAL_RATE": float(os.getenv('ZORTIFY_GLOBAL_RATE', 20.0)),  # Tope de peticiones/segundo del proceso, sumando todas las apps y cuentas
+        "GLOBAL_BURST": 10,
         "TOKEN_REFRESH_INTERVAL": 3000,
         "SESSION_TIMEOUT": 600,
-        "TIMEOUT": 30  # Tiempo máximo permitido para procesar una playlist
+        "PAGE_CONCURRENCY": 4,  # Máximo de páginas pidiéndose a la vez entre todas las playlists
+        "REQUEST_TIMEOUT": 10,  # Tiempo máximo de cada petición HTTP
+        "PAGE_TIMEOUT": 60,  # Tiempo máximo para obtener una página, incluyendo reintentos
+        "HEDGE_REQUESTS": True,  # Duplicar las páginas que tardan más que el p95
+        "HEDGE_MAX_RATIO": 0.1,  # Máximo de peticiones duplicadas respecto al total
+        "TIMEOUT": 300,  # Tiempo máximo permitido para procesar una playlist (lo que falte se retoma del checkpoint)
+        "API_CACHE_MODE": os.getenv('ZORTIFY_API_CACHE', 'off'),  # off, record o replay
+        "API_CACHE_PATH": 'api_cache.db',
+        "ACCOUNTS_PATH": os.getenv('ZORTIFY_ACCOUNTS', 'accounts.json'),  # Cuentas a escanear (si no existe, solo la del .env)
+        "METRICS": os.getenv('ZORTIFY_METRICS', '0') == '1',  # Métricas en /metrics y resumen al final del escaneo
+        "PROFILE_PATH": os.getenv('ZORTIFY_PROFILE'),  # Si se indica, perfila el escaneo por muestreo y guarda las pilas aquí
+        "PROFILE_INTERVAL": 0.005,
+        "WORK_QUEUE_PATH": os.getenv('ZORTIFY_WORK_QUEUE', 'work_queue.db'),  # Cola compartida del modo distribuido
+        "SHARD_PAGES": 20,  # Páginas por tarea en el modo distribuido
+        "LEASE_SECONDS": 60,  # Un worker que no renueva su lease en este tiempo pierde la tarea
+        "SHARD_POLL": 0.5,  # Intervalo de consulta de la cola cuando no hay novedades
+        "EXPORT_SHARDS_PATH": os.getenv('ZORTIFY_EXPORT_SHARDS'),  # Si se indica, exporta también shards para el frontend estático
+        "EXPORT_SHARD_SIZE": 100,  # Playlists por shard
+        "COVERS_PATH": os.getenv('ZORTIFY_COVERS', 'covers'),  # Caché local de portadas y miniaturas
+        "COVERS_MAX_MB": int(os.getenv('ZORTIFY_COVERS_MAX_MB', 200)),  # Al pasar de este tamaño se borran las menos usadas
+        "COVERS_WORKERS": 4,  # Descargas de portadas en paralelo (y conexiones al CDN)
+        "COVERS_PREFETCH": os.getenv('ZORTIFY_COVERS_PREFETCH', '1') == '1'  # Descargar las portadas durante el escaneo
     }
 CONFIG = load_config()
+
+# Métricas del escaneo; desactivadas, cada registro es solo la comprobación de un booleano
+metrics.enable(CONFIG['METRICS'])
+api_requests = metrics.Counter('zortify_api_requests_total', 'Peticiones a la API de Spotify por endpoint y código',
+                               ('endpoint', 'status'))
+api_latency = metrics.Histogram('zortify_api_request_seconds', 'Duración de las peticiones a la API', ('endpoint',))
+api_retries = metrics.Counter('zortify_api_retries_total', 'Reintentos por código de estado', ('status',))
+retry_sleep = metrics.Counter('zortify_retry_sleep_seconds_total', 'Tiempo dormido entre reintentos')
+rate_limiter_wait = metrics.Histogram('zortify_rate_limiter_wait_seconds', 'Espera por turno en los limitadores',
+                                      ('limiter',))
+received_bytes = metrics.Counter('zortify_http_received_bytes_total', 'Bytes recibidos de la API (descomprimidos)')
+playlist_queue_depth = metrics.Gauge('zortify_playlist_queue_depth', 'Playlists listadas esperando un worker',
+                                     fn=lambda: 0)
+store_queue_depth = metrics.Gauge('zortify_store_queue_depth', 'Escrituras pendientes de confirmar en los almacenes',
+                                  fn=lambda: sum(account.store.pending() for account in accounts or []))
 #
 # Inicialización de Spotify
-auth_manager = SpotifyOAuth(
-    client_id=os.getenv('SPOTIPY_CLIENT_ID'),
-    client_secret=os.getenv('SPOTIPY_CLIENT_SECRET'),
-    redirect_uri=os.getenv('SPOTIPY_REDIRECT_URI'),
-    scope="playlist-read-private"
-)
+_auth_manager: Optional[SpotifyOAuth] = None
+
+def default_auth_manager() -> SpotifyOAuth:
+    """Auth manager de la cuenta del .env, creado al primer uso"""
+    global _auth_manager
+    if _auth_manager is None:
+        _auth_manager = SpotifyOAuth(
+            client_id=os.getenv('SPOTIPY_CLIENT_ID'),
+            client_secret=os.getenv('SPOTIPY_CLIENT_SECRET'),
+            redirect_uri=os.getenv('SPOTIPY_REDIRECT_URI'),
+            scope="playlist-read-private"
+        )
+    return _auth_manager
+
+_image_cache: Optional[ImageCache] = None
+_image_cache_lock = threading.Lock()
+
+def get_image_cache() -> ImageCache:
+    """Caché de portadas, creada al primer uso"""
+    global _image_cache
+    if _image_cache is None:
+        with _image_cache_lock:
+            if _image_cache is None:
+                _image_cache = ImageCache(CONFIG['COVERS_PATH'], CONFIG['COVERS_MAX_MB'] * 1024 * 1024,
+                                          CONFIG['COVERS_WORKERS'])
+    return _image_cache
 
 class SpotifyAPIError(Exception):
     """Clase personalizada para errores de la API de Spotify"""
-    def __init__(self, message: str, error_type: str = None, status_code: int = None):
+    def __init__(self, message: str, error_type: str = None, status_code: int = None,
+                 retry_after: float = None):
         self.message = message
         self.error_type = error_type
         self.status_code = status_code
+        self.retry_after = retry_after
         super().__init__(self.message)
 
-# Diccionario global para almacenar resultados
-all_results = {}
-
-def save_to_results(playlist_data: Dict):
+def save_to_results(account: 'Account', playlist_data: Dict):
     """
-    Guarda los datos de una playlist en results.json
+    Encola los datos de una playlist en el almacén de resultados de la cuenta
     """
     try:
-        # Crear el archivo si no existe
-        if not os.path.exists('results.json'):
-            existing_results = {}
-        else:
-            with open('results.json', 'r', encoding='utf-8') as f:
-                existing_results = json.load(f)
-        
-        # Actualizar con los nuevos datos
-        existing_results.update(playlist_data)
-
-        # Ordenar los resultados por duración (de mayor a menor)
-        sorted_results = dict(sorted(existing_results.items(), key=lambda item: item[1]['duration']['days'] * 86400 + item[1]['duration']['hours'] * 3600 + item[1]['duration']['minutes'] * 60 + item[1]['duration']['seconds'], reverse=True))
-        
-        # Guardar el archivo actualizado
-        with open('results.json', 'w', encoding='utf-8') as f:
-            json.dump(sorted_results, f, ensure_ascii=False, indent=4)
-        logger.info(f"✅ Guardado en results.json: {list(playlist_data.keys())[0]}")
-    except json.JSONDecodeError as e:
-        logger.error(f"❌ Error de formato en results.json: {str(e)}")
+        for name, details in playlist_data.items():
+            account.store.put(name, details)
+        logger.info(f"✅ Guardado en el almacén de resultados: {list(playlist_data.keys())[0]}")
     except Exception as e:
         logger.error(f"❌ Error guardando resultados: {str(e)}")
 
 class RateLimiter:
-    """Control de velocidad para solicitudes a la API"""
-    def __init__(self, requests_per_second: float = 2.0):
-        self.last_request = 0
-        self.min_interval = 1.0 / requests_per_second
+    """
+    Token bucket compartido por todos los workers que usan la misma app.
+    La tasa se adapta estilo AIMD: se reduce a la mitad con cada 429 y crece
+    poco a poco con cada petición exitosa. Un Retry-After pausa a todos los workers.
+    """
+    def __init__(self, requests_per_second: float = 2.0, burst: int = 5,
+                 min_rate: float = 0.5, max_rate: float = 10.0, increase: float = 0.05):
+        self._lock = threading.Lock()
+        self.rate = requests_per_second
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
 
     def wait(self):
-        now = time.time()
-        elapsed = now - self.last_request
-        if elapsed < self.min_interval:
-            time.sleep(self.min_interval - elapsed)
-        self.last_request = time.time()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.paused_until:
+                    delay = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self, retry_after: Optional[float] = None):
+        with self._lock:
+            now = time.monotonic()
+            # Varios 429 de la misma ráfaga cuentan como una sola reducción
+            if now - self.last_decrease > 1.0 / self.rate:
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.last_decrease = now
+            self.tokens = 0.0
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+
+def new_page_planner(api_cache: ApiCache) -> PagePlanner:
+    track_fields(CONFIG['AGGREGATIONS'])  # Una agregación desconocida falla aquí y no en cada petición
+    # Grabar o reproducir la caché de la API necesita páginas fijas: sus claves incluyen el tamaño.
+    # Al reproducir se usa el tamaño con el que se grabó (las cachés viejas son de 50 tracks)
+    page_size = CONFIG['BATCH_SIZE']
+    if api_cache.replaying:
+        page_size = api_cache.recorded_page_size() or page_size
+    return PagePlanner(
+        page_size=page_size,
+        min_size=CONFIG['PAGE_SIZE_MIN'],
+        latency_budget=CONFIG['PAGE_LATENCY_BUDGET'],
+        throttle_budget=CONFIG['THROTTLE_BUDGET'],
+        adaptive=CONFIG['ADAPTIVE_PAGE_SIZE'] and api_cache.mode == 'off'
+    )
+
+def new_rate_limiter() -> RateLimiter:
+    return RateLimiter(
+        requests_per_second=1.0 / CONFIG['REQUEST_DELAY'],
+        burst=CONFIG['RATE_BURST'],
+        min_rate=CONFIG['RATE_MIN'],
+        max_rate=CONFIG['RATE_MAX'],
+        increase=CONFIG['RATE_INCREASE']
+    )
+
+# Spotify limita por app (client_id): las cuentas de una misma app comparten limitador,
+# y todas pasan además por el tope global del proceso (tasa fija, sin AIMD)
+app_rate_limiters: Dict[str, RateLimiter] = {}
+global_rate_limiter = RateLimiter(
+    requests_per_second=CONFIG['GLOBAL_RATE'],
+    burst=CONFIG['GLOBAL_BURST'],
+    min_rate=CONFIG['GLOBAL_RATE'],
+    max_rate=CONFIG['GLOBAL_RATE'],
+    increase=0
+)
 
-rate_limiter = RateLimiter()
+def app_rate_limiter(client_id: Optional[str]) -> RateLimiter:
+    if client_id not in app_rate_limiters:
+        app_rate_limiters[client_id] = new_rate_limiter()
+    return app_rate_limiters[client_id]
 
 def convertir_miliseconds(miliseconds: int) -> Dict[str, int]:
     seconds = miliseconds / 1000
@@ -120,17 +272,36 @@ def convertir_miliseconds(miliseconds: int) -> Dict[str, int]:
         "seconds": int(seconds)
     }
 
+SERVER_ERROR_CODES = (500, 502, 503, 504)
+
+def parse_retry_after(headers) -> Optional[float]:
+    """Lee la cabecera Retry-After (en segundos) de una respuesta de Spotify"""
+    try:
+        return float(headers.get('Retry-After'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
 def retry_with_backoff(func):
-    def wrapper(*args, **kwargs):
+    def wrapper(account: 'Account', *args, **kwargs):
         for i, delay in enumerate(CONFIG['RETRY_DELAY']):
             try:
-                return func(*args, **kwargs)
+                return func(account, *args, **kwargs)
             except SpotifyAPIError as e:
                 if e.status_code == 429:
-                    logger.warning(f"Rate limit alcanzado, esperando {delay} segundos")
-                    time.sleep(delay)
-                elif e.status_code in [500, 502, 503, 504]:
-                    logger.warning(f"Error de servidor: {e.message}, reintento {i+1}")
+                    # El limitador de la app pausa a todos sus workers el tiempo indicado por Spotify
+                    pause = e.retry_after or delay
+                    suppressed = throttle_log_sampler.sample(account.name)
+                    if suppressed is not None:
+                        logger.warning("Rate limit alcanzado (%s), esperando %s segundos (%d avisos omitidos)",
+                                       account.name, pause, suppressed,
+                                       extra={'account': account.name, 'suppressed': suppressed})
+                    api_retries.inc(status=429)
+                    account.rate_limiter.on_throttle(pause)
+                elif e.status_code in SERVER_ERROR_CODES:
+                    logger.warning("Error de servidor: %s, reintento %d", e.message, i + 1,
+                                   extra={'account': account.name})
+                    api_retries.inc(status=e.status_code)
+                    retry_sleep.inc(delay)
                     time.sleep(delay)
                 else:
                     raise
@@ -139,252 +310,705 @@ def retry_with_backoff(func):
                     logger.error(f"Error final después de {len(CONFIG['RETRY_DELAY'])} intentos: {e}")
                     raise
                 logger.warning(f"Error general: {e}, reintento {i+1}")
+                api_retries.inc(status='error')
+                retry_sleep.inc(delay)
                 time.sleep(delay)
         return None
     return wrapper
 
+# Tamaño de la última respuesta recibida en cada hilo, para medir los bytes por página
+last_response = threading.local()
+
+def count_received_bytes(response, *args, **kwargs):
+    last_response.size = len(response.content)
+    received_bytes.inc(last_response.size)
+
+def new_http_session(pool_size: int) -> requests.Session:
+    """Sesión HTTP con un pool de pool_size conexiones keep-alive y reintentos de conexión"""
+    http = requests.Session()
+    http.hooks['response'].append(count_received_bytes)
+    # Los 429 y los 5xx no se reintentan aquí: los 429 tienen que llegar al
+    # limitador compartido y los 5xx los reintenta retry_with_backoff. Si
+    # urllib3 agotara los reintentos de un 5xx, spotipy lo informaría como un
+    # 429 ("Max Retries") y un servidor caído frenaría al limitador
+    retry = Retry(
+        total=CONFIG['MAX_RETRIES'],
+        connect=None,
+        read=False,
+        allowed_methods=frozenset(['GET']),
+        backoff_factor=0.3,
+        # Sin esto urllib3 reintenta los 429 y 503 que traen Retry-After
+        respect_retry_after_header=False
+    )
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_size, max_retries=retry)
+    http.mount('https://', adapter)
+    http.mount('http://', adapter)
+    return http
+
 class SpotifySessionManager:
-    """Gestor de sesión Spotify"""
-    def __init__(self, auth_manager):
+    """
+    Gestor de sesión Spotify de una cuenta: un único cliente sobre un pool HTTP
+    que comparten todos los workers (y todas las cuentas, ya que el token va en
+    cada petición). El token se refresca en el auth manager sin recrear el
+    cliente, así las conexiones keep-alive se mantienen calientes.
+    """
+    def __init__(self, auth_manager, pool_size: int, http: Optional[requests.Session] = None):
         self.auth_manager = auth_manager
+        self.pool_size = pool_size
+        self.http = http
         self.sp = None
         self.last_refresh = 0
+        self._lock = threading.Lock()
         self.initialize_session()
 
     def initialize_session(self):
-        self.sp = spotipy.Spotify(auth_manager=self.auth_manager)
+        pool = 'pool compartido'
+        if self.http is None:
+            self.http = new_http_session(self.pool_size)
+            pool = f'pool de {self.pool_size} conexiones'
+        self.sp = spotipy.Spotify(auth_manager=self.auth_manager, requests_session=self.http,
+                                 requests_timeout=CONFIG['REQUEST_TIMEOUT'])
         self.last_refresh = time.time()
-        logger.info("🔄 Sesion inicializada/refrescada")
+        logger.info(f"🔄 Sesion inicializada ({pool})")
 
     def check_and_refresh(self):
-        if time.time() - self.last_refresh > CONFIG['TOKEN_REFRESH_INTERVAL']:
+        if time.time() - self.last_refresh <= CONFIG['TOKEN_REFRESH_INTERVAL']:
+            return
+        with self._lock:
+            # Otro worker pudo haber refrescado mientras esperábamos el lock
+            if time.time() - self.last_refresh <= CONFIG['TOKEN_REFRESH_INTERVAL']:
+                return
             logger.info("🔄 Refrescando token Spotify")
-            self.initialize_session()
+            token_info = self.auth_manager.cache_handler.get_cached_token()
+            if token_info and token_info.get('refresh_token'):
+                self.auth_manager.refresh_access_token(token_info['refresh_token'])
+            self.last_refresh = time.time()
 
     def get_client(self):
         self.check_and_refresh()
         return self.sp
 
-session_manager = SpotifySessionManager(auth_manager)
+    def pool_stats(self) -> Dict[str, Dict[str, int]]:
+        """Conexiones abiertas y peticiones hechas por host en el pool compartido"""
+        stats = {}
+        for adapter in set(self.http.adapters.values()):
+            for key in adapter.poolmanager.pools.keys():
+                pool = adapter.poolmanager.pools[key]
+                stats[pool.host] = {
+                    "connections": pool.num_connections,
+                    "requests": pool.num_requests
+                }
+        return stats
+
+ACCOUNT_NAME = re.compile(r'^[A-Za-z0-9_-]+$')
+
+class Account:
+    """
+    Una cuenta a escanear: su sesión y caché de token, su almacén de resultados
+    y su caché de la API. El limitador es el de su app (compartido con las
+    otras cuentas de la misma app) y weight es su parte de los workers.
+    El planificador de páginas decide el tamaño de las páginas de tracks.
+    La sesión de Spotify se crea la primera vez que se usa.
+    """
+    def __init__(self, name: str, auth_manager, http: requests.Session, store: ResultsStore,
+                 api_cache: ApiCache, rate_limiter: RateLimiter, weight: float = 1.0):
+        self.name = name
+        self.auth_manager = auth_manager
+        self.http = http
+        self.store = store
+        self.api_cache = api_cache
+        self.rate_limiter = rate_limiter
+        self.page_planner = new_page_planner(api_cache)
+        self.weight = weight
+        self.results = {}
+        self._session_manager: Optional[SpotifySessionManager] = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session_manager(self) -> SpotifySessionManager:
+        if self._session_manager is None:
+            with self._session_lock:
+                if self._session_manager is None:
+                    self._session_manager = SpotifySessionManager(
+                        self.auth_manager, pool_size=CONFIG['PAGE_CONCURRENCY'] + 1, http=self.http)
+        return self._session_manager
+
+    def wait(self):
+        """Espera turno en el limitador de la app y en el tope global"""
+        with rate_limiter_wait.time(limiter='app'):
+            self.rate_limiter.wait()
+        with rate_limiter_wait.time(limiter='global'):
+            global_rate_limiter.wait()
+
+def load_accounts() -> List[Account]:
+    """
+    Crea las cuentas de ACCOUNTS_PATH, un JSON con una lista de
+    {"name", "client_id", "client_secret", "redirect_uri", "weight"} (solo name
+    es obligatorio; el resto sale del .env). Cada cuenta guarda su token en
+    .cache-<name> y sus resultados en results-<name>.db/.json.
+    Sin ese archivo se escanea solo la cuenta del .env, con los archivos de siempre.
+    """
+    if not os.path.exists(CONFIG['ACCOUNTS_PATH']):
+        # Conexiones simultáneas: las páginas en vuelo más el listado de playlists
+        http = new_http_session(CONFIG['PAGE_CONCURRENCY'] + 1)
+        auth_manager = default_auth_manager()
+        return [Account('default', auth_manager, http, ResultsStore(*store_paths()),
+                        ApiCache(CONFIG['API_CACHE_MODE'], CONFIG['API_CACHE_PATH']),
+                        app_rate_limiter(auth_manager.client_id))]
+
+    with open(CONFIG['ACCOUNTS_PATH'], 'r', encoding='utf-8') as f:
+        specs = json.load(f)
+    # Un solo pool HTTP: las páginas en vuelo más un listado por cuenta
+    http = new_http_session(CONFIG['PAGE_CONCURRENCY'] + len(specs))
+    accounts = []
+    for spec in specs:
+        name = spec['name']
+        if not ACCOUNT_NAME.match(name) or any(a.name == name for a in accounts):
+            raise ValueError(f"Nombre de cuenta no válido o repetido: {name}")
+        client_id = spec.get('client_id', os.getenv('SPOTIPY_CLIENT_ID'))
+        account_auth = SpotifyOAuth(
+            client_id=client_id,
+            client_secret=spec.get('client_secret', os.getenv('SPOTIPY_CLIENT_SECRET')),
+            redirect_uri=spec.get('redirect_uri', os.getenv('SPOTIPY_REDIRECT_URI')),
+            scope="playlist-read-private",
+            cache_path=f'.cache-{name}'
+        )
+        root, ext = os.path.splitext(CONFIG['API_CACHE_PATH'])
+        accounts.append(Account(
+            name, account_auth, http,
+            ResultsStore(*store_paths(name)),
+            ApiCache(CONFIG['API_CACHE_MODE'], f'{root}-{name}{ext}'),
+            app_rate_limiter(client_id),
+            weight=float(spec.get('weight', 1.0))
+        ))
+    logger.info(f"👥 {len(accounts)} cuentas: {', '.join(a.name for a in accounts)}")
+    return accounts
+
+# Cuentas del proceso, cargadas al primer uso (benchmark.py las reemplaza)
+accounts: Optional[List[Account]] = None
+accounts_lock = threading.Lock()
+
+def get_accounts() -> List[Account]:
+    global accounts
+    with accounts_lock:
+        if accounts is None:
+            accounts = load_accounts()
+        return accounts
+
+def log_pool_stats():
+    for host, stats in get_accounts()[0].session_manager.pool_stats().items():
+        logger.info(f"🔌 {host}: {stats['requests']} peticiones sobre {stats['connections']} conexiones")
+
+def log_page_stats(scan_accounts: Optional[List[Account]] = None):
+    """Resumen del planificador de páginas de cada cuenta"""
+    for account in scan_accounts or get_accounts():
+        stats = account.page_planner.summary()
+        if stats['pages']:
+            logger.info(f"📐 {account.name}: {stats['pages']} páginas, {stats['items']} tracks, "
+                        f"{stats['bytes'] / 1024:.0f} KB ({stats['bytes_per_item']} bytes por track), "
+                        f"{stats['mean_page_seconds']}s por página, tamaño final {stats['page_size']}")
 
 @retry_with_backoff
-def get_playlist_tracks_batch(playlist_id: str, offset: int = 0):
+def get_playlist_tracks_batch(account: Account, playlist_id: str, offset: int = 0, snapshot_id: Optional[str] = None,
+                              limit: Optional[int] = None):
     """
-    Obtiene un lote de tracks de una playlist
+    Obtiene un lote de limit tracks de una playlist (de la caché en modo replay),
+    pidiendo solo los campos que usan las agregaciones activas
     """
-    rate_limiter.wait()
+    limit = limit or account.page_planner.page_size
+    if account.api_cache.replaying:
+        return account.api_cache.get_page(playlist_id, snapshot_id, offset, limit)
+    account.wait()
     try:
-        fields = (
-            'items(track(duration_ms,is_playable,type,name,track_number,'
-            'album(album_type))),'
-            'total,next'
-        )
-        return session_manager.get_client().playlist_items(
-            playlist_id,
-            offset=offset,
-            limit=CONFIG['BATCH_SIZE'],
-            fields=fields
-        )
+        last_response.size = 0
+        start = time.perf_counter()
+        with api_latency.time(endpoint='playlist_items'):
+            batch = account.session_manager.get_client().playlist_items(
+                playlist_id,
+                offset=offset,
+                limit=limit,
+                fields=track_fields(CONFIG['AGGREGATIONS'])
+            )
+        account.page_planner.record(len(batch['items']), time.perf_counter() - start, last_response.size)
+        api_requests.inc(endpoint='playlist_items', status=200)
+        account.rate_limiter.on_success()
+        if account.api_cache.recording:
+            account.api_cache.put_page(playlist_id, snapshot_id, offset, limit, batch)
+        return batch
     except spotipy.SpotifyException as e:
-        raise SpotifyAPIError(message=str(e), error_type=e.msg, status_code=e.http_status)
+        api_requests.inc(endpoint='playlist_items', status=e.http_status)
+        if e.http_status == 429:
+            account.page_planner.record_throttle()
+        raise SpotifyAPIError(message=str(e), error_type=e.msg, status_code=e.http_status,
+                              retry_after=parse_retry_after(e.headers))
+
+# Pool compartido para pedir páginas: su tamaño es el límite global de concurrencia
+page_executor = ThreadPoolExecutor(max_workers=CONFIG['PAGE_CONCURRENCY'], thread_name_prefix='page')
+
+# Se activa al recibir SIGINT/SIGTERM: los workers dejan de pedir páginas nuevas
+shutdown_event = threading.Event()
 
-def get_playlist_tracks(playlist: Dict) -> Optional[Dict]:
+class LatencyTracker:
+    """Latencias recientes de página (en segundos) para estimar percentiles"""
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.min_samples = min_samples
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+page_latency = LatencyTracker()
+hedge_stats = {'requests': 0, 'hedges': 0}
+hedge_lock = threading.Lock()
+
+def allow_hedge() -> bool:
+    """Limita las peticiones duplicadas a una fracción del total"""
+    with hedge_lock:
+        if hedge_stats['hedges'] >= CONFIG['HEDGE_MAX_RATIO'] * hedge_stats['requests']:
+            return False
+        hedge_stats['hedges'] += 1
+        return True
+
+async def fetch_page_hedged(account: Account, playlist_id: str, offset: int, limit: int,
+                            snapshot_id: Optional[str] = None) -> Optional[Dict]:
     """
-    Obtiene todos los tracks de una playlist, filtrando podcasts desde el inicio
+    Pide una página con un límite de PAGE_TIMEOUT. Si tarda más que el p95 de
+    las páginas recientes se lanza una petición duplicada y se usa la primera
+    que responda.
     """
-    try:
-        current_progress['last_playlist'] = playlist['name']
-        logger.info("=" * 50)
-        logger.info(f"🎵 Iniciando procesamiento de playlist: {playlist['name']}")
-        
-        total_duration_ms = 0
-        offset = 0
-        tracks_processed = 0
-        invalid_tracks = 0  # Contador para tracks no válidos (podcasts + no reproducibles)
-        total_tracks = playlist['tracks']['total']
-        logger.info(f"📝 Playlist: {total_tracks} tracks totales")
+    loop = asyncio.get_running_loop()
+    with hedge_lock:
+        hedge_stats['requests'] += 1
+    start = loop.time()
+    attempts = {loop.run_in_executor(page_executor, get_playlist_tracks_batch, account, playlist_id, offset,
+                                       snapshot_id, limit)}
+
+    hedge_after = page_latency.percentile(95) if CONFIG['HEDGE_REQUESTS'] else None
+    if hedge_after is not None and hedge_after < CONFIG['PAGE_TIMEOUT']:
+        done, _ = await asyncio.wait(attempts, timeout=hedge_after)
+        if not done and allow_hedge():
+            logger.info("🪃 Página %d más lenta que el p95 (%.2fs), enviando petición duplicada", offset, hedge_after,
+                        extra={'playlist_id': playlist_id, 'offset': offset})
+            attempts.add(loop.run_in_executor(page_executor, get_playlist_tracks_batch, account, playlist_id, offset,
+                                       snapshot_id, limit))
+
+    error = None
+    while attempts:
+        remaining = CONFIG['PAGE_TIMEOUT'] - (loop.time() - start)
+        done, attempts = await asyncio.wait(attempts, timeout=max(0, remaining),
+                                            return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            logger.warning("⌛ Página %d superó el límite de %ss", offset, CONFIG['PAGE_TIMEOUT'],
+                           extra={'playlist_id': playlist_id, 'offset': offset})
+            return None
+        for attempt in done:
+            if attempt.exception() is not None:
+                error = attempt.exception()
+            elif attempt.result():
+                page_latency.record(loop.time() - start)
+                return attempt.result()
+    # Ningún intento devolvió la página
+    if error is not None:
+        raise error
+    return None
+
+async def fetch_playlist_pages(account: Account, playlist_id: str, total_tracks: int, on_batch,
+                               ranges: Optional[List[Tuple[int, int]]] = None,
+                               snapshot_id: Optional[str] = None, follow_growth: bool = True) -> int:
+    """
+    Pide las páginas de una playlist de forma concurrente (hasta
+    PAGE_CONCURRENCY a la vez) y llama a on_batch(offset, limit, batch) a
+    medida que llegan, en cualquier orden. Solo se piden los tramos de ranges
+    (por defecto toda la playlist; el resto ya está en el checkpoint), que se
+    cortan en páginas al lanzarlas con el tamaño que elija el planificador de
+    la cuenta en ese momento.
+    Con follow_growth se piden también las páginas nuevas si la playlist creció.
+    Si se supera el tiempo máximo de la playlist (TIMEOUT) las páginas que
+    faltan se cancelan y quedan para la próxima ejecución.
+    Devuelve la cantidad de páginas que no se pudieron obtener.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + CONFIG['TIMEOUT']
+    planner = account.page_planner
+    cursor = PageCursor([(0, total_tracks)] if ranges is None else ranges)
+    known_total = total_tracks
+    pending = set()
+    missing_pages = 0
+    timed_out = False
 
-        while offset < total_tracks:
-            batch = get_playlist_tracks_batch(playlist['id'], offset)
+    async def fetch(offset: int, limit: int):
+        return offset, limit, await fetch_page_hedged(account, playlist_id, offset, limit, snapshot_id)
+
+    def launch():
+        # Cancelación cooperativa: no empezar páginas nuevas tras SIGTERM o pasado el plazo
+        while len(pending) < CONFIG['PAGE_CONCURRENCY'] and not shutdown_event.is_set() and loop.time() <= deadline:
+            page = cursor.next_page(planner.page_size)
+            if page is None:
+                return
+            pending.add(asyncio.ensure_future(fetch(*page)))
+
+    launch()
+    while pending:
+        done, pending = await asyncio.wait(pending, timeout=max(0, deadline - loop.time()),
+                                           return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            for task in pending:
+                task.cancel()
+            missing_pages += len(pending)
+            timed_out = True
+            break
+        for task in done:
+            offset, limit, batch = task.result()
             if not batch:
-                logger.warning("⚠️ No se pudo obtener el lote")
-                break
+                if not shutdown_event.is_set():
+                    logger.warning("⚠️ No se pudo obtener el lote en offset %d", offset,
+                                   extra={'playlist_id': playlist_id, 'offset': offset})
+                    missing_pages += 1
+                continue
 
-            for item in batch['items']:
-                track = item.get('track')
-                if not track:
-                    invalid_tracks += 1
-                    continue
+            on_batch(offset, limit, batch)
 
-                # Verificar si es un podcast o no es reproducible
-                if track['type'] == 'episode' or not track.get('is_playable', True):
-                    invalid_tracks += 1
-                    logger.debug(f"⏭️ Saltando track no válido: {track.get('name', 'Desconocido')} ({track['type']})")
-                    continue
+            # Si la playlist creció desde el listado, planificar los tracks que faltan
+            if follow_growth and batch.get('total', 0) > known_total:
+                cursor.extend(known_total, batch['total'])
+                known_total = batch['total']
+        launch()
+
+    # Lo que no se llegó a lanzar antes del plazo también queda pendiente
+    left = 0 if shutdown_event.is_set() else cursor.pages_left(planner.page_size)
+    if timed_out or left:
+        missing_pages += left
+        logger.warning(f"⌛ Playlist superó el límite de {CONFIG['TIMEOUT']}s, "
+                       f"{missing_pages} páginas quedan para la próxima ejecución")
+    return missing_pages
+
+def empty_totals() -> Dict[str, int]:
+    return {'duration_ms': 0, 'tracks_processed': 0, 'invalid_tracks': 0}
+
+def aggregate_batch(batch: Dict, totals: Dict, columns: Optional[TrackColumns] = None,
+                    log_context: Optional[Dict] = None):
+    """
+    Acumula la duración y los contadores de un lote de tracks, filtrando podcasts
+    y no reproducibles; los tracks válidos se agregan también a columns.
+    log_context (playlist_id, offset) acompaña los eventos de tracks saltados.
+    """
+    for item in batch['items']:
+        track = item.get('track')
+        if not track:
+            totals['invalid_tracks'] += 1
+            continue
+
+        # Verificar si es un podcast o no es reproducible
+        if track['type'] == 'episode' or not track.get('is_playable', True):
+            totals['invalid_tracks'] += 1
+            if logger.isEnabledFor(logging.DEBUG):
+                suppressed = skipped_track_sampler.sample()
+                if suppressed is not None:
+                    logger.debug("⏭️ Saltando track no válido: %s (%s)", track.get('id', 'sin id'), track['type'],
+                                 extra={**(log_context or {}), 'suppressed': suppressed})
+            continue
+
+        totals['duration_ms'] += track['duration_ms']
+        totals['tracks_processed'] += 1
+        if columns is not None:
+            columns.append(track)
+
+def build_playlist_entry(playlist: Dict, totals: Dict, complete: bool, stats: Optional[Dict] = None) -> Dict:
+    """Construye la entrada de results.json para una playlist"""
+    return {
+        "id": playlist['id'],
+        "duration": convertir_miliseconds(totals['duration_ms']),
+        "url": playlist['external_urls']['spotify'],
+        "image": playlist['images'][0]['url'] if playlist['images'] else None,
+        "total_tracks": totals['tracks_processed'],
+        "invalid_tracks": totals['invalid_tracks'],
+        "processing_complete": complete,
+        # Sin snapshot una playlist incompleta se vuelve a procesar (desde su checkpoint)
+        "snapshot_id": playlist.get('snapshot_id') if complete else None,
+        "track_stats": stats
+    }
+
+class PlaylistAccumulator:
+    """
+    Totales y columnas de tracks de una playlist en curso. Arranca desde el
+    checkpoint de una ejecución anterior y registra cada página nueva en él,
+    así que sirve igual para las páginas propias y para las que llegan de
+    los workers del modo distribuido.
+    """
+    def __init__(self, account: Account, playlist: Dict):
+        self.account = account
+        self.playlist = playlist
+        # Retomar desde el checkpoint si una ejecución anterior quedó a medias
+        # (páginas completadas: offset -> tamaño, que puede variar de una página a otra)
+        self.completed_pages, self.totals = account.store.load_checkpoint(playlist['id'], playlist.get('snapshot_id'))
+        # Columnas de tracks por página, para las estadísticas de la playlist
+        self.pages = (account.store.load_track_pages(playlist['id'], playlist.get('snapshot_id'))
+                      if self.completed_pages else {})
+        self.log_context = {'account': account.name, 'playlist_id': playlist['id']}
+        if self.completed_pages:
+            logger.info("♻️ Retomando desde checkpoint: %d páginas ya procesadas", len(self.completed_pages),
+                        extra=self.log_context)
+            progress.add_tracks(self.totals['tracks_processed'] + self.totals['invalid_tracks'])
+
+    def pending_ranges(self) -> List[Tuple[int, int]]:
+        """Tramos de la playlist que no cubre el checkpoint"""
+        return uncovered_ranges(self.playlist['tracks']['total'], self.completed_pages)
+
+    def add_page(self, offset: int, limit: int, page_totals: Dict, columns: TrackColumns):
+        if overlaps(self.completed_pages, offset, limit):
+            return  # Página repetida (una tarea reclamada dos veces): ya está sumada
+        self.completed_pages[offset] = limit
+        self.pages[offset] = columns
+        for key, value in page_totals.items():
+            self.totals[key] += value
+        progress.add_tracks(page_totals['tracks_processed'] + page_totals['invalid_tracks'])
+        if page_log_sampler.sample(self.playlist['id']) is not None:
+            logger.info("⏳ %s: procesados %d tracks válidos, %d inválidos", self.playlist['name'],
+                        self.totals['tracks_processed'], self.totals['invalid_tracks'],
+                        extra={**self.log_context, 'offset': offset})
+        # Registrar la página en el checkpoint (lo confirma el escritor del almacén)
+        self.account.store.checkpoint(self.playlist['id'], self.playlist.get('snapshot_id'), offset, limit,
+                                      page_totals, columns)
 
-                total_duration_ms += track['duration_ms']
-                tracks_processed += 1
-
-                if tracks_processed % 50 == 0:  # Reducido la frecuencia de logs
-                    logger.info(f"⏳ Procesados {tracks_processed} tracks válidos, {invalid_tracks} inválidos")
-                    # Guardar progreso parcial
-                    save_partial_progress(playlist['name'], {
-                        "id": playlist['id'],
-                        "duration": convertir_miliseconds(total_duration_ms),
-                        "url": playlist['external_urls']['spotify'],
-                        "image": playlist['images'][0]['url'] if playlist['images'] else None,
-                        "total_tracks": tracks_processed,
-                        "invalid_tracks": invalid_tracks,
-                        "processing_complete": False
-                    })
-
-            offset += CONFIG['BATCH_SIZE']
-
-        # Resultado final
+    def add_batch(self, offset: int, limit: int, batch: Dict):
+        page_totals = empty_totals()
+        columns = TrackColumns()
+        aggregate_batch(batch, page_totals, columns, {**self.log_context, 'offset': offset})
+        self.add_page(offset, limit, page_totals, columns)
+
+    def finish(self, missing_pages: int) -> Dict:
+        """Construye y guarda la entrada de la playlist"""
+        playlist, totals = self.playlist, self.totals
+        stats = (track_stats(TrackColumns.concat(self.pages[offset] for offset in sorted(self.pages)))
+                 if 'track_stats' in CONFIG['AGGREGATIONS'] else None)
         result = {
-            playlist['name']: {
-                "id": playlist['id'],
-                "duration": convertir_miliseconds(total_duration_ms),
-                "url": playlist['external_urls']['spotify'],
-                "image": playlist['images'][0]['url'] if playlist['images'] else None,
-                "total_tracks": tracks_processed,
-                "invalid_tracks": invalid_tracks,
-                "processing_complete": True
-            }
+            playlist['name']: build_playlist_entry(playlist, totals, complete=missing_pages == 0, stats=stats)
         }
 
-        all_results.update(result)
-        save_to_results(result)  # Guardar inmediatamente después de procesar cada playlist
-        
-        logger.info(f"✅ Playlist completada: {playlist['name']} - {tracks_processed} tracks válidos, {invalid_tracks} inválidos")
-        return result
+        self.account.results.update(result)
+        save_to_results(self.account, result)  # Guardar inmediatamente después de procesar cada playlist
+        if CONFIG['COVERS_PREFETCH']:
+            get_image_cache().prefetch([result[playlist['name']]['image']])
+        page_log_sampler.forget(playlist['id'])
 
-    except Exception as e:
-        logger.error(f"❌ Error procesando playlist: {str(e)}")
-        return None
+        if missing_pages:
+            logger.warning("⚠️ Playlist incompleta: %s - faltan %d páginas, se retomará en la próxima ejecución",
+                           playlist['name'], missing_pages, extra=self.log_context)
+        else:
+            logger.info("✅ Playlist completada: %s - %d tracks válidos, %d inválidos", playlist['name'],
+                        totals['tracks_processed'], totals['invalid_tracks'], extra=self.log_context)
+        return result
 
-def save_partial_progress(playlist_name: str, data: Dict):
+def get_playlist_tracks(account: Account, playlist: Dict) -> Optional[Dict]:
     """
-    Guarda el progreso parcial en un archivo temporal
+    Obtiene todos los tracks de una playlist, filtrando podcasts desde el inicio.
+    Las páginas se piden en paralelo y se agregan según van llegando.
     """
+    if shutdown_event.is_set():
+        return None
     try:
-        partial_file = f'partial_results_{playlist_name.replace("/", "_")}.json'
-        with open(partial_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        progress.playlist_started(playlist['name'])
+        total_tracks = playlist['tracks']['total']
+        logger.info("🎵 Iniciando procesamiento de playlist: %s (%d tracks)", playlist['name'], total_tracks,
+                    extra={'account': account.name, 'playlist_id': playlist['id']})
+
+        accumulator = PlaylistAccumulator(account, playlist)
+        missing_pages = asyncio.run(fetch_playlist_pages(account, playlist['id'], total_tracks, accumulator.add_batch,
+                                                         accumulator.pending_ranges(), playlist.get('snapshot_id')))
+
+        if shutdown_event.is_set():
+            logger.info("⏸️ Playlist interrumpida: %s - progreso guardado en el checkpoint", playlist['name'],
+                        extra={'account': account.name, 'playlist_id': playlist['id']})
+            return None
+
+        return accumulator.finish(missing_pages)
+
     except Exception as e:
-        logger.error(f"❌ Error guardando progreso parcial: {str(e)}")
+        logger.error("❌ Error procesando playlist %s: %s", playlist['name'], e,
+                     extra={'account': account.name, 'playlist_id': playlist['id']})
+        return None
 
 # Variables globales
 start_time = None
-current_progress = {
-    'last_playlist': None,
-    'playlists_processed': [],
-    'total_playlists': 0
-}
+
+class ScanProgress:
+    """Contadores del escaneo en curso, compartidos por los workers de forma segura"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.last_playlist = None
+            self.playlists_listed = 0
+            self.playlists_done = 0
+            self.tracks_total = 0
+            self.tracks_done = 0
+
+    def playlist_listed(self, total_tracks: int):
+        with self._lock:
+            self.playlists_listed += 1
+            self.tracks_total += total_tracks
+
+    def playlist_started(self, name: str):
+        with self._lock:
+            self.last_playlist = name
+
+    def add_tracks(self, count: int):
+        with self._lock:
+            self.tracks_done += count
+
+    def playlist_done(self):
+        with self._lock:
+            self.playlists_done += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            elapsed = time.time() - self.started_at
+            tracks_done = min(self.tracks_done, self.tracks_total)
+            return {
+                "elapsed_s": round(elapsed, 1),
+                "last_playlist": self.last_playlist,
+                "playlists_listed": self.playlists_listed,
+                "playlists_done": self.playlists_done,
+                "tracks_total": self.tracks_total,
+                "tracks_done": tracks_done,
+                "tracks_per_s": round(tracks_done / elapsed, 1) if elapsed > 0 else 0.0,
+                "eta_s": estimate_finish(tracks_done, self.tracks_total, elapsed)
+            }
+
+progress = ScanProgress()
 
 def format_elapsed_time(seconds):
     """Formatea el tiempo transcurrido en un formato legible"""
     return str(timedelta(seconds=int(seconds)))
 
-def show_elapsed_time():
-    """Muestra el tiempo transcurrido cada 5 segundos"""
-    global start_time
-    while True:
-        elapsed = time.time() - start_time
-        logger.info(f"⏱️ Tiempo transcurrido: {format_elapsed_time(elapsed)}")
-        time.sleep(5)
+def show_elapsed_time(stop: threading.Event, interval: float = 5):
+    """Muestra el tiempo transcurrido y la velocidad cada `interval` segundos hasta que se active stop"""
+    while not stop.wait(interval):
+        snapshot = progress.snapshot()
+        logger.info(f"⏱️ Tiempo transcurrido: {format_elapsed_time(snapshot['elapsed_s'])} - "
+                    f"{snapshot['tracks_per_s']} tracks/s")
 
-def load_existing_results() -> Dict:
-    """Carga los resultados existentes desde results.json y devuelve un conjunto de IDs de playlists."""
-    if os.path.exists('results.json'):
-        with open('results.json', 'r', encoding='utf-8') as f:
-            existing_results = json.load(f)
-            # Extraer las IDs de las playlists ya procesadas
-            processed_playlists = {details['id'] for details in existing_results.values()}
-            return existing_results, processed_playlists
-    return {}, set()  # Retornar un diccionario vacío y un conjunto vacío si no existe
+def load_existing_results(account: Account) -> Tuple[Dict, Dict[str, Optional[str]]]:
+    """
+    Carga los resultados existentes del almacén de la cuenta y devuelve también
+    un diccionario id de playlist -> snapshot_id con el que se procesó.
+    """
+    existing_results = account.store.load()
+    # Las entradas antiguas no tienen snapshot_id y se reprocesan una vez
+    processed_playlists = {details['id']: details.get('snapshot_id') for details in existing_results.values()}
+    return existing_results, processed_playlists
 
-def get_playlists() -> List[Dict]:
+def remove_from_results(account: Account, playlist_ids: List[str]):
     """
-    Obtiene y procesa todas las playlists del usuario, sin límite de 50.
+    Elimina del almacén las playlists que ya no existen en la cuenta
     """
-    global start_time
-    start_time = time.time()
-    
-    logger.info("\n" + "=" * 50)
-    logger.info("🚀 INICIANDO PROCESO DE ANÁLISIS DE PLAYLISTS")
-    
-    existing_results, processed_playlists = load_existing_results()  # Cargar resultados existentes
+    account.store.delete(playlist_ids)
+    logger.info(f"🗑️ Eliminadas del almacén {len(playlist_ids)} playlists borradas")
 
-    playlists = []  # Inicializar la lista de playlists
+def slim_playlist(playlist: Dict) -> Dict:
+    """Se queda solo con los campos de la playlist que usan los workers"""
+    return {
+        "id": playlist['id'],
+        "name": playlist['name'],
+        "snapshot_id": playlist.get('snapshot_id'),
+        "tracks": {"total": playlist['tracks']['total']},
+        "external_urls": {"spotify": playlist['external_urls']['spotify']},
+        "images": [{"url": playlist['images'][0]['url']}] if playlist.get('images') else []
+    }
 
-    def api_call(q):
-        try:
-            logger.info("🔄 Intentando conectar con Spotify...")
-            sp = spotipy.Spotify(
-                auth_manager=auth_manager,
-                requests_timeout=10,
-                retries=3
-            )
-            offset = 0
-            while True:
-                results = sp.current_user_playlists(limit=50, offset=offset)
-                playlists.extend(results['items'])  # Agregar las playlists obtenidas
-                if results['next'] is None:
-                    break
-                offset += 50  # Incrementar el offset para la siguiente página
-            q.put(playlists)
-        except Exception as e:
-            q.put(e)
-    
+@retry_with_backoff
+def get_user_playlists_page(account: Account, offset: int, limit: int = 50) -> Dict:
+    """
+    Obtiene una página del listado de playlists del usuario (de la caché en
+    modo replay). Los 429 y 5xx se reintentan como las páginas de tracks.
+    """
+    if account.api_cache.replaying:
+        return account.api_cache.get_listing(offset, limit)
+    account.wait()
     try:
-        logger.info("📥 Iniciando obtención de playlists...")
-        q = queue.Queue()
-        thread = threading.Thread(target=api_call, args=(q,))
-        thread.daemon = True
-        thread.start()
-        
-        # Esperar respuesta con timeout
-        for i in range(6):
-            if thread.is_alive():
-                logger.warning(f"⏳ Esperando respuesta de Spotify... ({(i+1)*5} segundos)")
-                thread.join(timeout=5)
-            else:
-                break
-        
-        if thread.is_alive():
-            total_time = time.time() - start_time
-            logger.error("❌ Timeout - No se recibió respuesta de Spotify después de 30 segundos")
-            logger.info(f"⏱️ Tiempo total transcurrido: {format_elapsed_time(total_time)}")
-            return []
-
-        result = q.get_nowait()
-        if isinstance(result, Exception):
-            logger.error(f"❌ Error al obtener playlists: {str(result)}")
-            return []
-        
-        logger.info(f"✅ Conexión establecida - Total de playlists encontradas: {len(playlists)}")
+        with api_latency.time(endpoint='current_user_playlists'):
+            results = account.session_manager.get_client().current_user_playlists(limit=limit, offset=offset)
+    except spotipy.SpotifyException as e:
+        api_requests.inc(endpoint='current_user_playlists', status=e.http_status)
+        raise SpotifyAPIError(message=str(e), error_type=e.msg, status_code=e.http_status,
+                              retry_after=parse_retry_after(e.headers))
+    api_requests.inc(endpoint='current_user_playlists', status=200)
+    account.rate_limiter.on_success()
+    if account.api_cache.recording:
+        account.api_cache.put_listing(offset, limit, results)
+    return results
 
-        # Filtrar playlists ya procesadas
-        playlists_to_process = [pl for pl in playlists if pl['id'] not in processed_playlists]
+def get_playlists(account: Account, processed_playlists: Optional[Dict[str, Optional[str]]] = None) -> Iterator[Dict]:
+    """
+    Lista todas las playlists del usuario página a página y va entregando las
+    nuevas o modificadas a medida que llegan, sin esperar al listado completo.
+    processed_playlists (id -> snapshot_id ya procesado) evita volver a leer
+    el almacén si quien llama ya lo cargó.
+    """
+    global start_time
+    start_time = time.time()
 
-        if not playlists_to_process:
-            logger.info("📂 No hay nuevas playlists para procesar.")
-            return []  # No hay playlists nuevas para procesar
+    logger.info("\n" + "=" * 50)
+    logger.info(f"🚀 INICIANDO PROCESO DE ANÁLISIS DE PLAYLISTS ({account.name})")
 
-        return playlists_to_process  # Devolver solo las playlists que no han sido procesadas
+    if processed_playlists is None:
+        processed_playlists = account.store.snapshots()
+    # En modo replay se recalcula toda la biblioteca desde la caché
+    skip_unchanged = not account.api_cache.replaying
+    listed_ids = set()
+    unchanged = 0
+    to_process = 0
 
-    except KeyboardInterrupt:
-        total_time = time.time() - start_time
-        logger.info("\n" + "=" * 50)
-        logger.info("👋 Programa interrumpido por el usuario")
-        logger.info(f"⏱️ Tiempo total de ejecución: {format_elapsed_time(total_time)}")
-        sys.exit(0)
+    try:
+        logger.info("🔄 Intentando conectar con Spotify...")
+        offset = 0
+        while True:
+            if shutdown_event.is_set():
+                # Sin el listado completo no se sabe qué playlists se borraron: no se quita ninguna
+                logger.info(f"🛑 Listado de {account.name} interrumpido en offset {offset}")
+                return
+            results = get_user_playlists_page(account, offset)
+            if results is None:
+                raise SpotifyAPIError(f"Página del listado en offset {offset} sin respuesta tras los reintentos")
+            for playlist in results['items']:
+                if not playlist:
+                    continue
+                listed_ids.add(playlist['id'])
+                # Saltar las playlists cuyo snapshot no cambió desde el último escaneo
+                if (skip_unchanged and playlist['id'] in processed_playlists
+                        and processed_playlists[playlist['id']] == playlist.get('snapshot_id')):
+                    unchanged += 1
+                    continue
+                to_process += 1
+                yield slim_playlist(playlist)
+            if results['next'] is None:
+                break
+            offset += 50  # Incrementar el offset para la siguiente página
     except Exception as e:
         total_time = time.time() - start_time
-        logger.error(f"❌ Error: {str(e)}")
+        logger.error(f"❌ Error al obtener playlists de {account.name}: {str(e)}")
         logger.info(f"⏱️ Tiempo total de ejecución: {format_elapsed_time(total_time)}")
-        return []
+        return
+
+    logger.info(f"✅ Listado completo ({account.name}) - Total de playlists encontradas: {len(listed_ids)}")
+
+    # Quitar las playlists que ya no están en la cuenta (solo con el listado completo)
+    deleted = [playlist_id for playlist_id in processed_playlists if playlist_id not in listed_ids]
+    if deleted:
+        remove_from_results(account, deleted)
+    logger.info(f"🔁 {to_process} playlists nuevas o modificadas, {unchanged} sin cambios, {len(deleted)} eliminadas")
 
 def check_and_display_existing_results(existing_results: Dict) -> bool:
     """
@@ -423,55 +1047,582 @@ def check_and_display_existing_results(existing_results: Dict) -> bool:
         return False
 
 def signal_handler(signum, frame):
-    """Manejador para Ctrl+C"""
-    total_time = time.time() - start_time
+    """Manejador para Ctrl+C y SIGTERM: detiene los workers y guarda los checkpoints"""
+    shutdown_event.set()
+    total_time = time.time() - start_time if start_time else 0
     logger.info("\n" + "=" * 50)
     logger.info("👋 Programa interrumpido por el usuario")
+    for account in accounts or []:
+        account.store.flush()
+    logger.info("💾 Checkpoints guardados, la próxima ejecución retomará desde aquí")
     logger.info(f"⏱️ Tiempo total de ejecución: {format_elapsed_time(total_time)}")
     sys.exit(0)
 
-# Registrar el manejador de señales
-signal.signal(signal.SIGINT, signal_handler)
-signal.signal(signal.SIGTERM, signal_handler)
-
-def process_playlists():
-    playlists = get_playlists()
-    if playlists:  # Solo procesar si hay playlists para analizar
-        with ThreadPoolExecutor(max_workers=CONFIG['MAX_WORKERS']) as executor:
-            futures = {executor.submit(get_playlist_tracks, pl): pl for pl in playlists}
-            for future in futures:
-                try:
-                    future.result()  # Esperar a que se complete el procesamiento de cada playlist
-                except Exception as e:
-                    logger.error(f"❌ Error procesando playlist {futures[future]['name']}: {str(e)}")
-    else:
+def install_signal_handlers():
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+
+def estimate_finish(tracks_done: int, tracks_total: int, elapsed: float) -> Optional[float]:
+    """Estima los segundos que faltan a partir de la velocidad observada (tracks/segundo)"""
+    if tracks_done <= 0 or elapsed <= 0:
+        return None
+    return (tracks_total - tracks_done) / (tracks_done / elapsed)
+
+def process_playlists(scan_accounts: Optional[List[Account]] = None,
+                      on_event: Optional[Callable[[str, Dict], None]] = None,
+                      known_snapshots: Optional[Dict[str, Dict[str, Optional[str]]]] = None):
+    """
+    Procesa las playlists de todas las cuentas a medida que llegan sus listados,
+    con un único pool de workers. Entre cuentas el reparto es justo según lo
+    ya procesado y el peso de cada una; dentro de una cuenta se toma siempre la
+    playlist más larga de las ya listadas (LPT). Cada playlist terminada se
+    reporta en cuanto acaba (también a on_event, si se indica).
+    known_snapshots (cuenta -> id -> snapshot_id) evita releer los almacenes.
+    """
+    scan_accounts = scan_accounts or get_accounts()
+    known_snapshots = known_snapshots or {}
+    by_name = {account.name: account for account in scan_accounts}
+    work = FairQueue()
+    completed = queue.Queue()
+    progress.reset()
+    playlist_queue_depth.fn = work.__len__
+
+    def feed(account: Account):
+        try:
+            for playlist in get_playlists(account, known_snapshots.get(account.name)):
+                total = playlist['tracks']['total']
+                progress.playlist_listed(total)
+                work.put(account.name, -total, total, playlist)
+        finally:
+            work.close(account.name)
+
+    def worker():
+        while True:
+            item = work.get()
+            if item is None:
+                completed.put(None)
+                return
+            name, playlist = item
+            account = by_name[name]
+            result = None
+            try:
+                result = get_playlist_tracks(account, playlist)
+            except Exception as e:
+                logger.error(f"❌ Error procesando playlist {playlist['name']}: {str(e)}")
+            completed.put((account, playlist, result))
+
+    for account in scan_accounts:
+        work.register(account.name, account.weight)
+        threading.Thread(target=feed, args=(account,), name=f'playlist-listing-{account.name}', daemon=True).start()
+
+    with ThreadPoolExecutor(max_workers=CONFIG['MAX_WORKERS']) as executor:
+        for _ in range(CONFIG['MAX_WORKERS']):
+            executor.submit(worker)
+
+        finished_workers = 0
+        try:
+            while finished_workers < CONFIG['MAX_WORKERS']:
+                item = completed.get()
+                if item is None:
+                    finished_workers += 1
+                    continue
+
+                account, playlist, result = item
+                progress.playlist_done()
+                snapshot = progress.snapshot()
+                # Mientras se sigue listando el total crece, así que la estimación es optimista al principio
+                if snapshot['eta_s'] is not None:
+                    finish = datetime.now() + timedelta(seconds=snapshot['eta_s'])
+                    logger.info(f"🏁 {snapshot['playlists_done']}/{snapshot['playlists_listed']} playlists - "
+                                f"fin estimado {finish:%H:%M:%S} (faltan {format_elapsed_time(snapshot['eta_s'])})")
+                if on_event:
+                    if result:
+                        name, details = next(iter(result.items()))
+                        on_event('playlist', {"account": account.name, "name": name, **details})
+                    on_event('progress', snapshot)
+        finally:
+            # Con SIGINT/SIGTERM signal_handler corta este bucle con SystemExit: vaciar la
+            # cola despierta a los workers que esperan en get() y el pool se cierra sin
+            # esperar a que terminen los listados (al terminar normal ya no queda nada)
+            work.shutdown()
+
+    if not progress.playlists_listed:
         logger.info("📂 No se encontraron playlists nuevas para procesar.")
 
-def save_all_results():
+# Modo distribuido: un coordinador reparte tareas de páginas en una cola SQLite
+# compartida y varios procesos worker (en esta máquina o en otras) las resuelven
+
+def new_work_queue() -> LeaseQueue:
+    return LeaseQueue(CONFIG['WORK_QUEUE_PATH'], lease_seconds=CONFIG['LEASE_SECONDS'])
+
+def shard_tasks(account: Account, playlist: Dict, ranges: List[Tuple[int, int]]) -> List[Tuple[str, int, Dict]]:
     """
-    Guarda todos los resultados acumulados en results.json al finalizar el procesamiento.
+    Parte los tramos pendientes de una playlist en tareas de SHARD_PAGES
+    páginas de BATCH_SIZE tracks, las playlists más largas primero. Cada
+    worker corta su tramo en páginas con el tamaño que elija su planificador.
     """
+    span = CONFIG['SHARD_PAGES'] * CONFIG['BATCH_SIZE']
+    chunks = [(begin, min(begin + span, end)) for start, end in ranges for begin in range(start, end, span)]
+    tasks = []
+    for begin, end in chunks:
+        key = f"{account.name}:{playlist['id']}:{playlist.get('snapshot_id')}:{begin}"
+        payload = {
+            "account": account.name,
+            "playlist": playlist,
+            "range": [begin, end],
+            # Solo la última tarea pide las páginas nuevas si la playlist creció
+            "follow_growth": end == chunks[-1][1]
+        }
+        tasks.append((key, -playlist['tracks']['total'], payload))
+    return tasks
+
+def run_shard_task(account: Account, payload: Dict) -> Dict:
+    """Resuelve una tarea en un worker: pide sus páginas y devuelve los agregados de cada una"""
+    playlist = payload['playlist']
+    pages = []
+
+    def on_batch(offset: int, limit: int, batch: Dict):
+        page_totals = empty_totals()
+        columns = TrackColumns()
+        aggregate_batch(batch, page_totals, columns,
+                        {'account': account.name, 'playlist_id': playlist['id'], 'offset': offset})
+        pages.append({"offset": offset, "limit": limit, "totals": page_totals, "columns": columns.to_payload()})
+
+    missing_pages = asyncio.run(fetch_playlist_pages(account, playlist['id'], playlist['tracks']['total'], on_batch,
+                                                     [tuple(payload['range'])], playlist.get('snapshot_id'),
+                                                     follow_growth=payload['follow_growth']))
+    return {"pages": pages, "missing_pages": missing_pages}
+
+def run_shard_worker(work_queue: LeaseQueue):
+    """
+    Worker del modo distribuido: MAX_WORKERS hilos reclaman tareas de la cola
+    mientras haya un escaneo abierto, y un hilo aparte renueva sus leases.
+    """
+    owner = f'{socket.gethostname()}:{os.getpid()}'
+    by_name = {account.name: account for account in get_accounts()}
+    active: Dict[str, str] = {}  # clave de tarea -> dueño (un dueño por hilo)
+    active_lock = threading.Lock()
+    stop = threading.Event()
+
+    def heartbeats():
+        while not stop.wait(work_queue.lease_seconds / 3):
+            with active_lock:
+                leases = list(active.items())
+            for key, task_owner in leases:
+                if not work_queue.heartbeat(key, task_owner):
+                    logger.warning(f"⚠️ Lease perdido: {key}")
+
+    def work(n: int):
+        task_owner = f'{owner}:{n}'
+        while not shutdown_event.is_set():
+            task = work_queue.claim(task_owner)
+            if task is None:
+                if not work_queue.has_open_runs():
+                    return
+                time.sleep(CONFIG['SHARD_POLL'])
+                continue
+            with active_lock:
+                active[task.key] = task_owner
+            try:
+                result = run_shard_task(by_name[task.payload['account']], task.payload)
+                if not work_queue.complete(task.key, task_owner, result):
+                    logger.warning(f"⚠️ Resultado descartado, otro worker tomó la tarea: {task.key}")
+            except Exception as e:
+                logger.error(f"❌ Error en la tarea {task.key}: {str(e)}")
+                work_queue.fail(task.key, task_owner, str(e))
+            finally:
+                with active_lock:
+                    del active[task.key]
+
+    logger.info(f"👷 Worker {owner} esperando tareas en {work_queue.path}")
+    threading.Thread(target=heartbeats, name='lease-heartbeat', daemon=True).start()
+    with ThreadPoolExecutor(max_workers=CONFIG['MAX_WORKERS'], thread_name_prefix='shard') as executor:
+        for n in range(CONFIG['MAX_WORKERS']):
+            executor.submit(work, n)
+    stop.set()
+    log_page_stats()
+    logger.info(f"👷 Worker {owner} sin más tareas, saliendo")
+
+def coordinate_scan(work_queue: LeaseQueue, local_workers: int = 0, scan_accounts: Optional[List[Account]] = None):
+    """
+    Coordinador del modo distribuido: lista las playlists, encola sus páginas
+    pendientes (según el checkpoint) como tareas y va sumando los agregados que
+    devuelven los workers. Cada página se registra en el checkpoint al llegar,
+    así que si el coordinador se cae la próxima ejecución retoma desde ahí
+    (y adopta las tareas que sigan en la cola). Con local_workers lanza esa
+    cantidad de procesos worker en esta máquina.
+    """
+    scan_accounts = scan_accounts or get_accounts()
+    by_name = {account.name: account for account in scan_accounts}
+    run_id = uuid.uuid4().hex[:12]
+    work_queue.open_run(run_id)
+    progress.reset()
+    cli_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cli.py')
+    workers = [subprocess.Popen([sys.executable, cli_path, 'worker']) for _ in range(local_workers)]
+    # (cuenta, id de playlist) -> [acumulador, tareas sin terminar, páginas que faltan]
+    open_playlists: Dict[Tuple[str, str], list] = {}
+    last_merge = time.monotonic()
+
+    def merge():
+        for key, payload, state, result, error in work_queue.take_finished(run_id):
+            entry = open_playlists.get((payload['account'], payload['playlist']['id']))
+            if entry is None:
+                continue
+            accumulator = entry[0]
+            if state == 'done':
+                for page in result['pages']:
+                    accumulator.add_page(page['offset'], page['limit'], page['totals'],
+                                         TrackColumns.from_payload(page['columns']))
+                entry[2] += result['missing_pages']
+            else:
+                logger.error(f"❌ Tarea fallida {key}: {error}")
+                begin, end = payload['range']
+                entry[2] += -(-(end - begin) // CONFIG['BATCH_SIZE'])
+            entry[1] -= 1
+            if entry[1] == 0:
+                accumulator.finish(entry[2])
+                progress.playlist_done()
+                del open_playlists[(payload['account'], payload['playlist']['id'])]
+
     try:
-        # Ordenar los resultados por duración (de mayor a menor)
-        sorted_results = dict(sorted(all_results.items(), key=lambda item: item[1]['duration']['days'] * 86400 + item[1]['duration']['hours'] * 3600 + item[1]['duration']['minutes'] * 60 + item[1]['duration']['seconds'], reverse=True))
-        
-        # Guardar el archivo actualizado
-        with open('results.json', 'w', encoding='utf-8') as f:
-            json.dump(sorted_results, f, ensure_ascii=False, indent=4)
-        logger.info("✅ Todos los resultados guardados en results.json")
+        for account in scan_accounts:
+            for playlist in get_playlists(account):
+                progress.playlist_listed(playlist['tracks']['total'])
+                accumulator = PlaylistAccumulator(by_name[account.name], playlist)
+                ranges = accumulator.pending_ranges()
+                if not ranges:
+                    accumulator.finish(0)
+                    progress.playlist_done()
+                    continue
+                tasks = shard_tasks(account, playlist, ranges)
+                open_playlists[(account.name, playlist['id'])] = [accumulator, len(tasks), 0]
+                work_queue.enqueue(run_id, tasks)
+                # Ir sumando resultados mientras se lista
+                if time.monotonic() - last_merge > CONFIG['SHARD_POLL']:
+                    merge()
+                    last_merge = time.monotonic()
+
+        logger.info(f"📬 Listado completo, esperando {len(open_playlists)} playlists de los workers")
+        while open_playlists and not shutdown_event.is_set():
+            merge()
+            if open_playlists:
+                time.sleep(CONFIG['SHARD_POLL'])
+    finally:
+        if shutdown_event.is_set():
+            # El escaneo sigue abierto: sus tareas se adoptan en la próxima ejecución
+            for worker in workers:
+                worker.terminate()
+        else:
+            work_queue.close_run(run_id)
+        for worker in workers:
+            worker.wait()
+
+def log_metrics_summary():
+    """Resumen de las métricas del escaneo en el log (solo con METRICS activado)"""
+    if not metrics.REGISTRY.enabled:
+        return
+    logger.info("📈 Métricas del escaneo:")
+    for line in metrics.REGISTRY.summary():
+        logger.info(f"   {line}")
+
+@contextmanager
+def profiled():
+    """Perfila el bloque por muestreo si PROFILE_PATH está configurado"""
+    if not CONFIG['PROFILE_PATH']:
+        yield
+        return
+    profiler = metrics.SamplingProfiler(CONFIG['PROFILE_INTERVAL'])
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        profiler.write(CONFIG['PROFILE_PATH'])
+        logger.info(f"🔬 Perfil guardado en {CONFIG['PROFILE_PATH']} - funciones con más muestras:")
+        for frame, samples in profiler.top(10):
+            logger.info(f"   {samples:6d}  {frame}")
+
+def save_all_results(scan_accounts: Optional[List[Account]] = None):
+    """
+    Confirma las escrituras pendientes y exporta el results.json de cada cuenta para el frontend.
+    """
+    for account in scan_accounts or get_accounts():
+        try:
+            account.store.flush()
+            account.store.export_json()
+            logger.info(f"✅ Todos los resultados guardados en {account.store.json_path}")
+            if CONFIG['EXPORT_SHARDS_PATH']:
+                shards_dir = os.path.join(CONFIG['EXPORT_SHARDS_PATH'], account.name)
+                manifest = account.store.export_shards(shards_dir, CONFIG['EXPORT_SHARD_SIZE'])
+                logger.info(f"🧩 {len(manifest['shards'])} shards exportados en {shards_dir}")
+        except Exception as e:
+            logger.error(f"❌ Error guardando resultados de {account.name}: {str(e)}")
+    if CONFIG['COVERS_PREFETCH']:
+        prefetch_covers(scan_accounts or get_accounts())
+
+def prefetch_covers(scan_accounts: List[Account]):
+    """
+    Deja en caché las portadas de todas las playlists guardadas (las de las
+    playlists sin cambios no pasan por el escaneo) y espera a que terminen
+    las descargas, incluidas las que se encolaron durante el escaneo.
+    """
+    image_cache = get_image_cache()
+    try:
+        queued = 0
+        for account in scan_accounts:
+            queued += image_cache.prefetch(details.get('image') for _, details in account.store.iter_sorted())
+        if queued:
+            logger.info(f"🖼️ Descargando {queued} portadas en {CONFIG['COVERS_PATH']}")
+        image_cache.drain()
     except Exception as e:
-        logger.error(f"❌ Error guardando resultados: {str(e)}")
+        logger.error(f"❌ Error descargando portadas: {str(e)}")
+
+def scan_all(scan_accounts: Optional[List[Account]] = None):
+    """
+    Escaneo completo desde la línea de comandos: muestra lo que ya hay en el
+    almacén de cada cuenta (una sola lectura, que también dice qué playlists
+    no cambiaron) y procesa el resto.
+    """
+    scan_accounts = scan_accounts or get_accounts()
+    known_snapshots = {}
+    for account in scan_accounts:
+        existing_results, known_snapshots[account.name] = load_existing_results(account)
+        check_and_display_existing_results(existing_results)
+
+    # Continuar con el proceso normal, mostrando el tiempo transcurrido
+    stop_timer = threading.Event()
+    threading.Thread(target=show_elapsed_time, args=(stop_timer,), daemon=True).start()
+    with profiled():
+        process_playlists(scan_accounts, known_snapshots=known_snapshots)
+    stop_timer.set()
 
-if __name__ == '__main__':
-    logger.info("🚀 Iniciando aplicación")
-    
-    # Si existe results.json, mostrar contenido y continuar
-    existing_results, processed_playlists = load_existing_results()
-    check_and_display_existing_results(existing_results)  # Mostrar resultados existentes
-
-    # Continuar con el proceso normal
-    process_playlists()
-    
     # Guardar todos los resultados al finalizar
-    save_all_results()
+    save_all_results(scan_accounts)
+    log_pool_stats()
+    log_page_stats(scan_accounts)
+    log_metrics_summary()
     logger.info("✅ Todas las playlists procesadas y guardadas")
+
+# Índices en memoria que sirven la API, uno por cuenta (creados a la primera
+# consulta); se recargan cuando su almacén cambia
+results_indexes: Dict[str, ResultsIndex] = {}
+
+def results_index_for(account_name: Optional[str]) -> ResultsIndex:
+    """Índice de la cuenta pedida con ?account=...; por defecto la primera"""
+    by_name = {account.name: account for account in get_accounts()}
+    if account_name is None:
+        account_name = next(iter(by_name))
+    if account_name not in by_name:
+        raise InvalidQueryError(f"Cuenta desconocida: {account_name} (opciones: {', '.join(by_name)})")
+    if account_name not in results_indexes:
+        results_indexes.setdefault(account_name, ResultsIndex(by_name[account_name].store))
+    return results_indexes[account_name]
+
+def cached_json(results_index: ResultsIndex, build) -> Response:
+    """
+    Respuesta JSON con ETag según la huella del contenido del índice y la URL pedida
+    (If-None-Match devuelve 304 sin construir nada) y gzip si el cliente lo acepta.
+    """
+    results_index.refresh()
+    etag = hashlib.sha1(f'{results_index.fingerprint}:{request.full_path}'.encode('utf-8')).hexdigest()[:20]
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        body = json.dumps(build(), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        response = Response(body, mimetype='application/json')
+        if request.accept_encodings['gzip'] and len(body) > 1024:
+            response.set_data(gzip.compress(body, compresslevel=5))
+            response.headers['Content-Encoding'] = 'gzip'
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.errorhandler(InvalidQueryError)
+def handle_invalid_query(e):
+    return jsonify({"error": str(e)}), 400
+
+@app.errorhandler(OverlapUnavailableError)
+def handle_overlap_unavailable(e):
+    return jsonify({"error": str(e)}), 409
+
+@app.route('/api/playlists')
+def api_playlists():
+    """
+    Playlists paginadas: ?sort=duration|tracks&order=desc|asc&listened=true|false&limit=50&cursor=...&account=...
+    """
+    results_index = results_index_for(request.args.get('account'))
+    listened = request.args.get('listened')
+    if listened not in (None, 'true', 'false'):
+        raise InvalidQueryError(f"Filtro listened no válido: {listened} (opciones: true, false)")
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+    except ValueError:
+        raise InvalidQueryError(f"limit no válido: {request.args.get('limit')}")
+    return cached_json(results_index, lambda: results_index.page(
+        sort=request.args.get('sort', 'duration'),
+        order=request.args.get('order', 'desc'),
+        listened=None if listened is None else listened == 'true',
+        limit=limit,
+        cursor=request.args.get('cursor')
+    ))
+
+def run_scan_job(publish: Callable[[str, Dict], None]):
+    """Escaneo completo lanzado desde la API"""
+    shutdown_event.clear()
+    with profiled():
+        process_playlists(on_event=publish)
+    save_all_results()
+    log_metrics_summary()
+
+scan_jobs = JobManager(run_scan_job, progress.snapshot)
+
+@app.route('/api/scans', methods=['POST'])
+def api_start_scan():
+    try:
+        job = scan_jobs.start()
+    except JobConflictError as e:
+        return jsonify({"error": str(e)}), 409
+    response = jsonify(job.status())
+    response.status_code = 202
+    response.headers['Location'] = f'/api/scans/{job.id}'
+    return response
+
+@app.route('/api/scans')
+def api_scans():
+    return jsonify([job.status() for job in scan_jobs.list()])
+
+@app.route('/api/scans/<job_id>')
+def api_scan_status(job_id: str):
+    job = scan_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Escaneo no encontrado: {job_id}"}), 404
+    return jsonify(job.status())
+
+@app.route('/api/scans/<job_id>/events')
+def api_scan_events(job_id: str):
+    """
+    Server-Sent Events del escaneo: 'playlist' por cada playlist terminada,
+    'progress' con tracks/s y ETA, y 'done' o 'failed' al final.
+    Con Last-Event-ID el cliente retoma donde se quedó.
+    """
+    job = scan_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Escaneo no encontrado: {job_id}"}), 404
+    try:
+        start = int(request.headers.get('Last-Event-ID', -1)) + 1
+    except ValueError:
+        start = 0
+
+    def stream():
+        index = start
+        while True:
+            events = job.events_since(index, timeout=15)
+            if not events:
+                if job.finished:
+                    return
+                yield ': keepalive\n\n'
+                continue
+            for event_id, kind, data in events:
+                yield f'id: {event_id}\nevent: {kind}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+            index = events[-1][0] + 1
+            if job.finished and events[-1][1] in ('done', 'failed'):
+                return
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Métricas en formato Prometheus (con ZORTIFY_METRICS=1)"""
+    if not metrics.REGISTRY.enabled:
+        return jsonify({"error": "Métricas desactivadas: iniciar con ZORTIFY_METRICS=1"}), 404
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/stats')
+def api_stats():
+    """Estadísticas de duración y tipo de álbum de todos los tracks de la biblioteca: ?account=..."""
+    results_index = results_index_for(request.args.get('account'))
+    return cached_json(results_index, results_index.library_stats)
+
+@app.route('/api/overlap')
+def api_overlap():
+    """
+    Duplicados entre playlists: duración única de la biblioteca, tracks que
+    solo están en cada playlist y pares con más tracks en común (Jaccard):
+    ?min_jaccard=0.05&limit=100&account=...
+    """
+    results_index = results_index_for(request.args.get('account'))
+    try:
+        min_jaccard = float(request.args.get('min_jaccard', 0))
+        limit = min(max(int(request.args.get('limit', 100)), 1), 1000)
+    except ValueError:
+        raise InvalidQueryError("min_jaccard y limit deben ser numéricos")
+    return cached_json(results_index, lambda: results_index.overlap(min_jaccard, limit))
+
+@app.route('/api/playlists/search')
+def api_search():
+    """Búsqueda por nombre sin acentos ni mayúsculas, por prefijo y aproximada: ?q=...&limit=20&account=..."""
+    results_index = results_index_for(request.args.get('account'))
+    query = request.args.get('q', '')
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+    except ValueError:
+        raise InvalidQueryError(f"limit no válido: {request.args.get('limit')}")
+    return cached_json(results_index, lambda: results_index.search(query, limit))
+
+# Cuentas cuyas portadas ya se registraron en la caché desde este proceso
+covers_registered: set = set()
+
+@app.route('/api/covers/<key>/<int:size>')
+def api_cover(key: str, size: int):
+    """
+    Miniatura de una portada (size 0: la original), de la caché local. Las
+    rutas salen del campo thumbnail que la API agrega a cada playlist; como
+    la clave es el hash de la URL del CDN, que cambia con la imagen, se
+    pueden cachear para siempre. Si no hay miniatura (sin Pillow, o si la
+    portada no se pudo bajar o redimensionar) redirige a la portada del CDN:
+    el original entero bajo esta ruta pesaría más que la página a la que
+    debía aligerar.
+    """
+    if size not in THUMBNAIL_SIZES:
+        raise InvalidQueryError(f"Tamaño no válido: {size} (opciones: {', '.join(map(str, THUMBNAIL_SIZES))})")
+    etag = f'{key}-{size}'
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        image_cache = get_image_cache()
+        url = image_cache.url_of(key)
+        if url is None:
+            # Playlists guardadas antes de la caché o escaneadas por otro proceso
+            for account in get_accounts():
+                if url is None and account.name not in covers_registered:
+                    image_cache.register(details.get('image') for _, details in account.store.iter_sorted())
+                    covers_registered.add(account.name)
+                    url = image_cache.url_of(key)
+        if url is None:
+            return jsonify({"error": f"Portada no encontrada: {key}"}), 404
+        found = image_cache.get(key, size) if size == 0 or image_cache.can_resize else None
+        if found is None or found[2] != size:
+            response = redirect(url)
+            response.headers['Cache-Control'] = 'public, max-age=3600'
+            return response
+        response = Response(found[0], mimetype=found[1])
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+@app.route('/api/playlists/<playlist_id>')
+def api_playlist(playlist_id: str):
+    results_index = results_index_for(request.args.get('account'))
+    results_index.refresh()
+    entry = results_index.by_id.get(playlist_id)
+    if entry is None:
+        return jsonify({"error": f"Playlist no encontrada: {playlist_id}"}), 404
+    return cached_json(results_index, lambda: {**entry, "overlap": results_index.playlist_overlap(playlist_id)})
+
+if __name__ == '__main__':
+    # Compatibilidad con "python zortify.py [comando]": la línea de comandos está en cli.py
+    import cli
+    sys.modules.setdefault('zortify', sys.modules[__name__])
+    sys.exit(cli.main())
@@ -0,0 +1,68 @@
+import json
+import sqlite3
+
+from migrations import SCHEMA_VERSION, migrate_entry, migrate_json_file, store_version, upgrade_store
+from results_json import iter_results, write_results
+from results_store import SCHEMA
+
+def old_entries():
+    """Entradas como las escribían las versiones anteriores del escaneo"""
+    return {
+        "Vieja": {"id": "p1", "duration": {"days": 0, "hours": 1, "minutes": 2, "seconds": 3},
+                  "url": "https://open.spotify.com/playlist/p1", "image": None, "total_tracks": 10,
+                  "podcasts_filtered": 2},
+        "Con miniatura": {"id": "p2", "duration": {"days": 0, "hours": 0, "minutes": 5, "seconds": 0},
+                          "url": "https://open.spotify.com/playlist/p2", "image": "https://i.scdn.co/image/x",
+                          "thumbnail": "/api/covers/abc/160", "total_tracks": 3, "invalid_tracks": 0,
+                          "processing_complete": True, "listened": True},
+    }
+
+def test_migrate_entry_is_idempotent():
+    for entry in old_entries().values():
+        assert migrate_entry(entry)
+        once = json.loads(json.dumps(entry))
+        assert not migrate_entry(entry)
+        assert entry == once
+    entry = old_entries()["Vieja"]
+    migrate_entry(entry)
+    assert entry['invalid_tracks'] == 2 and entry['processing_complete'] and entry['listened'] is False
+    assert 'podcasts_filtered' not in entry
+
+def test_migrate_json_file_is_idempotent(tmp_path):
+    path = str(tmp_path / 'results.json')
+    write_results(path, old_entries().items())
+    assert migrate_json_file(path) == 2
+    once = dict(iter_results(path))
+    assert migrate_json_file(path) == 0
+    assert dict(iter_results(path)) == once
+    assert all('thumbnail' not in entry for entry in once.values())
+
+def old_store(path: str) -> sqlite3.Connection:
+    """Base sin sellar (versión 0) con el esquema anterior a track_id y page_size"""
+    conn = sqlite3.connect(path, isolation_level=None)
+    schema = (SCHEMA.replace("    track_id BLOB NOT NULL DEFAULT X'',\n", "")
+              .replace("    page_size INTEGER NOT NULL,\n", ""))
+    conn.executescript(schema)
+    for name, entry in old_entries().items():
+        conn.execute("INSERT INTO playlists (id, name, duration_s, snapshot_id, data) VALUES (?, ?, 0, NULL, ?)",
+                     (entry['id'], name, json.dumps(entry)))
+    return conn
+
+def snapshot(conn: sqlite3.Connection):
+    tables = {table: [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+              for table in ('playlists', 'checkpoints', 'track_pages')}
+    rows = conn.execute("SELECT id, data FROM playlists ORDER BY id").fetchall()
+    return tables, rows, store_version(conn)
+
+def test_upgrade_store_is_idempotent(tmp_path):
+    conn = old_store(str(tmp_path / 'results.db'))
+    upgrade_store(conn)
+    once = snapshot(conn)
+    assert once[2] == SCHEMA_VERSION
+    assert 'track_id' in once[0]['track_pages'] and 'page_size' in once[0]['checkpoints']
+    # Repetir la migración (también forzando los pasos desde la versión 0) no cambia nada
+    upgrade_store(conn)
+    assert snapshot(conn) == once
+    conn.execute("PRAGMA user_version = 0")
+    upgrade_store(conn)
+    assert snapshot(conn) == once
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from results_json import iter_results, write_results
+
+def sample_entries(count: int = 30):
+    return {
+        f'Playlist {i} ñandú': {
+            "id": f'p{i}',
+            "duration": {"days": i % 3, "hours": 12345 + i, "minutes": 59, "seconds": 7},
+            "total_tracks": 10 ** (i % 7) + i,
+            "invalid_tracks": 0,
+            "listened": i % 2 == 0,
+            "snapshot_id": None if i % 5 == 0 else f'snap-{i}',
+            "ratio": i / 7,
+            "track_stats": {"tracks": i, "album_types": [1, 22, 333]}
+        }
+        for i in range(count)
+    }
+
+@pytest.mark.parametrize('separators', [(',', ':'), (', ', ': ')])
+def test_roundtrip_compact_at_every_small_chunk_size(tmp_path, separators):
+    # Con bloques chicos los números, strings y literales quedan cortados en todos los puntos posibles
+    entries = sample_entries()
+    path = tmp_path / 'results.json'
+    path.write_text(json.dumps(entries, ensure_ascii=False, separators=separators), encoding='utf-8')
+    for chunk_size in range(1, 48):
+        assert dict(iter_results(str(path), chunk_size)) == entries, chunk_size
+
+def test_roundtrip_write_results(tmp_path):
+    entries = sample_entries()
+    path = tmp_path / 'results.json'
+    write_results(str(path), entries.items())
+    assert json.loads(path.read_text(encoding='utf-8')) == entries
+    for chunk_size in (1, 2, 3, 7, 64, 1 << 16):
+        assert list(iter_results(str(path), chunk_size)) == list(entries.items())
+
+def test_scalar_at_end_of_chunk_is_not_truncated(tmp_path):
+    # Dentro de un objeto el decoder pide más hasta la llave de cierre; un valor
+    # suelto no: con bloques de 8 el primero termina en '{"a":123'
+    path = tmp_path / 'results.json'
+    path.write_text('{"a":1234567,"b":-2.5e10}', encoding='utf-8')
+    for chunk_size in range(1, 30):
+        assert dict(iter_results(str(path), chunk_size)) == {"a": 1234567, "b": -2.5e10}, chunk_size
+
+def test_empty_results(tmp_path):
+    path = tmp_path / 'results.json'
+    write_results(str(path), [])
+    assert list(iter_results(str(path), 1)) == []
+
+def test_invalid_results(tmp_path):
+    path = tmp_path / 'results.json'
+    path.write_text('{"a": {"n": 1}', encoding='utf-8')
+    with pytest.raises(ValueError):
+        list(iter_results(str(path), 4))